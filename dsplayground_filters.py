@@ -0,0 +1,225 @@
+import numpy as np
+
+# Streaming filter stages shared by Tone Mixer and Spectrum Analyzer. Every stage keeps its state between
+# calls to process(), so feeding a signal in blocks gives the same output as feeding it in one go: that's
+# what lets the same chain run on the analyzer's live blocks and on a whole Tone Mixer signal.
+#
+# Chains can be written as text, stages separated by commas, frequencies in Hz:
+#   dc [r]                                  DC blocker, pole at r (default 0.995)
+#   lowpass F [Q], highpass F [Q]           biquads (RBJ cookbook), Q defaults to 0.707
+#   bandpass F [Q], notch F [Q]             biquads centered on F
+#   fir-lowpass F [taps], fir-highpass F [taps], fir-bandpass F1 F2 [taps]
+#                                           windowed-sinc FIRs, 255 taps by default, at most 65535
+# e.g. "dc, highpass 100, fir-lowpass 3000 1023"
+
+default_q = 1/np.sqrt(2)
+default_num_taps = 255
+max_num_taps = 65535 # already ~1.5 s at 44.1 kHz, more is almost certainly a typo
+default_dc_pole = 0.995
+
+
+class FIRFilter:
+    # Short filters convolve directly, longer ones use overlap-save FFT convolution so the cost per sample
+    # grows with log(num_taps) instead of num_taps
+    def __init__(self, taps, fft_threshold=64):
+        self.taps = np.asarray(taps)
+        if self.taps.ndim != 1 or len(self.taps) == 0:
+            raise ValueError("FIR taps must be a non-empty 1D array")
+        self.use_fft = len(self.taps) > fft_threshold
+        if self.use_fft:
+            self.nfft = 1 << int(np.ceil(np.log2(4*len(self.taps)))) # ~3/4 of every FFT is new output
+            self.step_size = self.nfft - len(self.taps) + 1
+            self.H = np.fft.fft(self.taps, self.nfft)
+        self.reset()
+
+    def reset(self):
+        self.history = np.zeros(len(self.taps) - 1, dtype=self.taps.dtype)
+
+    def process(self, x):
+        x = np.asarray(x)
+        if len(x) == 0:
+            return x.copy()
+        num_taps = len(self.taps)
+        buf = np.concatenate([self.history, x])
+        self.history = buf[len(buf) - (num_taps - 1):]
+
+        if not self.use_fft:
+            return np.convolve(buf, self.taps, mode="valid")
+
+        # overlap-save, all segments in one batch of FFTs
+        num_segments = -(-len(x) // self.step_size)
+        padded = np.zeros(num_segments*self.step_size + num_taps - 1, dtype=buf.dtype)
+        padded[:len(buf)] = buf
+        segments = np.lib.stride_tricks.sliding_window_view(padded, self.nfft)[::self.step_size]
+        if np.iscomplexobj(padded) or np.iscomplexobj(self.taps):
+            y = np.fft.ifft(np.fft.fft(segments, axis=1) * self.H, axis=1)
+        else:
+            y = np.fft.irfft(np.fft.rfft(segments, axis=1) * self.H[:self.nfft//2 + 1], self.nfft, axis=1)
+        return y[:, num_taps - 1:].ravel()[:len(x)]
+
+
+class BiquadCascade:
+    # Second-order sections in scipy's sos layout, one row of [b0, b1, b2, a0, a1, a2] per section.
+    # Uses scipy.signal.sosfilt when scipy is installed, otherwise a plain Python loop (fine for short audio clips).
+    def __init__(self, sos):
+        sos = np.atleast_2d(np.asarray(sos, dtype=np.float64))
+        if sos.shape[1] != 6:
+            raise ValueError("sos must have 6 columns: b0, b1, b2, a0, a1, a2")
+        self.sos = sos / sos[:, 3:4] # normalize so a0 = 1
+        self.reset()
+
+    def reset(self):
+        self.zi = np.zeros((len(self.sos), 2))
+
+    def then(self, other):
+        # merges two cascades into one so a run of biquads costs a single sosfilt call
+        merged = BiquadCascade(np.vstack([self.sos, other.sos]))
+        merged.zi = np.vstack([self.zi, other.zi])
+        return merged
+
+    def process(self, x):
+        x = np.asarray(x)
+        if len(x) == 0:
+            return x.copy()
+        try:
+            from scipy.signal import sosfilt
+        except ImportError:
+            sosfilt = None
+
+        if sosfilt is not None:
+            y, self.zi = sosfilt(self.sos, x, zi=self.zi.astype(np.result_type(self.zi, x)))
+            return y
+
+        # transposed direct form II, same state layout as sosfilt
+        y = x.astype(np.result_type(x, np.float64))
+        zi = self.zi.astype(y.dtype)
+        for section, (b0, b1, b2, _, a1, a2) in enumerate(self.sos):
+            z1, z2 = zi[section]
+            out = np.empty_like(y)
+            for n, sample in enumerate(y):
+                out[n] = b0*sample + z1
+                z1 = b1*sample - a1*out[n] + z2
+                z2 = b2*sample - a2*out[n]
+            zi[section] = z1, z2
+            y = out
+        self.zi = zi
+        return y
+
+
+class DCBlocker(BiquadCascade):
+    # y[n] = x[n] - x[n-1] + r*y[n-1], the closer r is to 1 the narrower the notch at 0 Hz
+    def __init__(self, r=default_dc_pole):
+        if not 0 < r < 1:
+            raise ValueError("DC blocker pole must be between 0 and 1")
+        super().__init__([[1, -1, 0, 1, -r, 0]])
+
+
+class FilterChain:
+    def __init__(self, stages=()):
+        self.stages = []
+        for stage in stages:
+            self.append(stage)
+
+    def append(self, stage):
+        if self.stages and isinstance(stage, BiquadCascade) and isinstance(self.stages[-1], BiquadCascade):
+            self.stages[-1] = self.stages[-1].then(stage)
+        else:
+            self.stages.append(stage)
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def process(self, x):
+        for stage in self.stages:
+            x = stage.process(x)
+        return x
+
+
+# Filter design
+def _check_freq(freq, sample_rate):
+    if not 0 < freq < sample_rate/2:
+        raise ValueError(f"Filter frequency {freq} Hz must be between 0 and Nyquist ({sample_rate/2} Hz)")
+
+
+def biquad(kind, freq, sample_rate, q=default_q):
+    _check_freq(freq, sample_rate)
+    if not 0 < q < np.inf: # also catches nan
+        raise ValueError("Q must be a finite number greater than 0")
+    w0 = 2*np.pi*freq/sample_rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0)/(2*q)
+    a = [1 + alpha, -2*cos_w0, 1 - alpha]
+    if kind == "lowpass":
+        b = [(1 - cos_w0)/2, 1 - cos_w0, (1 - cos_w0)/2]
+    elif kind == "highpass":
+        b = [(1 + cos_w0)/2, -(1 + cos_w0), (1 + cos_w0)/2]
+    elif kind == "bandpass":
+        b = [alpha, 0, -alpha] # 0 dB peak gain
+    elif kind == "notch":
+        b = [1, -2*cos_w0, 1]
+    else:
+        raise ValueError(f"Unknown biquad type {kind!r}")
+    return BiquadCascade([b + a])
+
+
+def fir_taps(kind, freqs, sample_rate, num_taps=default_num_taps):
+    for freq in freqs:
+        _check_freq(freq, sample_rate)
+    if not 1 <= num_taps <= max_num_taps:
+        raise ValueError(f"Number of taps must be between 1 and {max_num_taps}")
+    if kind == "highpass" and num_taps % 2 == 0:
+        num_taps += 1 # spectral inversion needs a center tap
+    n = np.arange(num_taps) - (num_taps - 1)/2
+    window = np.hamming(num_taps)
+
+    def lowpass(cutoff):
+        taps = np.sinc(2*cutoff/sample_rate*n) * window
+        return taps / np.sum(taps) # unity gain at DC
+
+    if kind == "lowpass":
+        return lowpass(freqs[0])
+    elif kind == "highpass":
+        taps = -lowpass(freqs[0])
+        taps[(num_taps - 1)//2] += 1
+        return taps
+    elif kind == "bandpass":
+        low, high = sorted(freqs)
+        return lowpass(high) - lowpass(low)
+    raise ValueError(f"Unknown FIR type {kind!r}")
+
+
+def _parse_num_taps(value):
+    if not np.isfinite(value) or value != int(value) or not 1 <= value <= max_num_taps:
+        raise ValueError(f"Number of taps must be a whole number between 1 and {max_num_taps}, not {value:g}")
+    return int(value)
+
+
+def parse_filter_chain(spec, sample_rate):
+    # turns "dc, lowpass 1000" into a FilterChain, raises ValueError with a readable message on bad input
+    chain = FilterChain()
+    for stage_text in spec.replace(";", ",").split(","):
+        words = stage_text.split()
+        if not words:
+            continue
+        name = words[0].lower()
+        try:
+            args = [float(word) for word in words[1:]]
+        except ValueError:
+            raise ValueError(f"Filter stage {stage_text.strip()!r} has a non-numeric argument") from None
+        if not np.all(np.isfinite(args)): # float() happily takes "nan" and "inf"
+            raise ValueError(f"Filter stage {stage_text.strip()!r} has a non-finite argument")
+
+        if name == "dc" and len(args) <= 1:
+            chain.append(DCBlocker(*args))
+        elif name in ("lowpass", "highpass", "bandpass", "notch") and 1 <= len(args) <= 2:
+            chain.append(biquad(name, args[0], sample_rate, *args[1:]))
+        elif name in ("fir-lowpass", "fir-highpass") and 1 <= len(args) <= 2:
+            num_taps = _parse_num_taps(args[1]) if len(args) > 1 else default_num_taps
+            chain.append(FIRFilter(fir_taps(name[4:], args[:1], sample_rate, num_taps)))
+        elif name == "fir-bandpass" and 2 <= len(args) <= 3:
+            num_taps = _parse_num_taps(args[2]) if len(args) > 2 else default_num_taps
+            chain.append(FIRFilter(fir_taps("bandpass", args[:2], sample_rate, num_taps)))
+        else:
+            raise ValueError(f"Can't understand filter stage {stage_text.strip()!r}")
+    return chain
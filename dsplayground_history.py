@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import threading
+
+import numpy as np
+
+# Session history for the Spectrum Analyzer's waterfall: every PSD row is appended to memory-mapped files on
+# disk, so hours of history can be scrolled back through while RAM use stays the same.
+#
+# A session is a directory holding meta.json plus, per level, levelN.psd (float16 rows) and levelN.ts
+# (float64 timestamps, which double as the index). Level 0 has every row, level N+1 has one row per
+# `decimation` rows of level N, max-held so short bursts stay visible when zoomed out. Files grow
+# `chunk_rows` rows at a time; unused rows have a timestamp of 0, which is how the row count is recovered
+# on reopen.
+
+default_chunk_rows = 1024
+default_decimation = 4
+default_max_levels = 8
+
+
+class _Level:
+    def __init__(self, prefix, fft_size, chunk_rows, readonly):
+        self.psd_path = prefix + ".psd"
+        self.ts_path = prefix + ".ts"
+        self.fft_size = fft_size
+        self.chunk_rows = chunk_rows
+        self.readonly = readonly
+        if not readonly:
+            for path in (self.psd_path, self.ts_path):
+                open(path, "ab").close()
+        self._map()
+        self.count = self._recover_count()
+
+    def _map(self):
+        capacity = os.path.getsize(self.ts_path) // 8
+        if capacity == 0:
+            self.ts = np.zeros(0)
+            self.rows = np.zeros((0, self.fft_size), dtype=np.float16)
+            return
+        mode = "r" if self.readonly else "r+"
+        self.ts = np.memmap(self.ts_path, dtype="<f8", mode=mode, shape=(capacity,))
+        self.rows = np.memmap(self.psd_path, dtype="<f2", mode=mode, shape=(capacity, self.fft_size))
+
+    def _recover_count(self):
+        if len(self.ts) == 0:
+            return 0
+        last_chunk = max(0, len(self.ts) - self.chunk_rows)
+        return last_chunk + int(np.count_nonzero(self.ts[last_chunk:]))
+
+    def _grow(self):
+        self.flush()
+        capacity = len(self.ts) + self.chunk_rows
+        # drop the old maps before resizing, Windows won't resize a file that is still mapped
+        self.ts = self.rows = None
+        with open(self.ts_path, "r+b") as f:
+            f.truncate(capacity * 8)
+        with open(self.psd_path, "r+b") as f:
+            f.truncate(capacity * self.fft_size * 2)
+        self._map()
+
+    def append(self, row, timestamp):
+        if self.count == len(self.ts):
+            self._grow()
+        self.rows[self.count] = row
+        self.ts[self.count] = timestamp
+        self.count += 1
+
+    def flush(self):
+        if isinstance(self.ts, np.memmap) and not self.readonly:
+            self.rows.flush()
+            self.ts.flush()
+
+
+class HistoryStore:
+    # Reopening an existing session checks it against whichever of fft_size, sample_rate and center_freq are
+    # given and raises ValueError on a mismatch, so one session never mixes different settings
+    def __init__(self, path, fft_size=None, sample_rate=None, center_freq=None, readonly=False,
+                 chunk_rows=default_chunk_rows, decimation=default_decimation, max_levels=default_max_levels):
+        self.path = path
+        self.readonly = readonly
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            for key, value in (("fft_size", fft_size), ("sample_rate", sample_rate), ("center_freq", center_freq)):
+                if value is not None and value != meta[key]:
+                    raise ValueError(f"History at {path} was recorded with {key} {meta[key]:g}, not {value:g}")
+        elif readonly:
+            raise FileNotFoundError(f"No history session at {path}")
+        else:
+            if fft_size is None:
+                raise ValueError("fft_size is needed to start a new history session")
+            meta = {"version": 1, "fft_size": int(fft_size), "sample_rate": sample_rate or 0.0, "center_freq": center_freq or 0.0,
+                    "chunk_rows": chunk_rows, "decimation": decimation, "max_levels": max_levels}
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, "w") as f:
+                json.dump(meta, f, indent=1)
+
+        self.fft_size = meta["fft_size"]
+        self.sample_rate = meta["sample_rate"]
+        self.center_freq = meta["center_freq"]
+        self.chunk_rows = meta["chunk_rows"]
+        self.decimation = meta["decimation"]
+        self.max_levels = meta["max_levels"]
+        self._lock = threading.Lock() # appends come from the SDR thread, reads from the GUI
+        self.closed = False
+
+        self.levels = []
+        for level in range(self.max_levels):
+            if (level > 0 or readonly) and not os.path.exists(self._prefix(level) + ".ts"):
+                break # level 0 always exists when writing, the others appear once there's enough data
+            self.levels.append(_Level(self._prefix(level), self.fft_size, self.chunk_rows, readonly))
+
+        # one partially max-held row per level above 0, picked back up from the level below when reopening
+        self._pending = [None] * self.max_levels
+        for level in range(1, len(self.levels) + 1):
+            if level >= self.max_levels:
+                break
+            below = self.levels[level - 1]
+            done = self.levels[level].count * self.decimation if level < len(self.levels) else 0
+            if 0 < below.count - done < self.decimation:
+                rows = below.rows[done:below.count].astype(np.float32)
+                self._pending[level] = [rows.max(axis=0), float(below.ts[done]), len(rows)]
+
+    def _prefix(self, level):
+        return os.path.join(self.path, f"level{level}")
+
+    def __len__(self):
+        return self.levels[0].count if self.levels else 0
+
+    @property
+    def num_levels(self):
+        return len(self.levels)
+
+    def level_len(self, level):
+        return self.levels[level].count
+
+    def append(self, PSD, timestamp=None):
+        if self.readonly:
+            raise ValueError("History was opened read-only")
+        row = np.asarray(PSD, dtype=np.float32)
+        if row.shape != (self.fft_size,):
+            raise ValueError(f"PSD row has {len(row)} bins, history expects {self.fft_size}")
+        if timestamp is None:
+            timestamp = time.time()
+        if timestamp <= 0:
+            raise ValueError("History timestamps must be positive")
+        with self._lock:
+            if self.closed:
+                raise ValueError("History is closed")
+            if len(self) and timestamp < self.levels[0].ts[len(self) - 1]:
+                raise ValueError("History timestamps must not go backwards")
+            self._append(0, row, timestamp)
+
+    def _append(self, level, row, timestamp):
+        if level == len(self.levels):
+            self.levels.append(_Level(self._prefix(level), self.fft_size, self.chunk_rows, False))
+        self.levels[level].append(row, timestamp)
+
+        above = level + 1
+        if above >= self.max_levels:
+            return
+        pending = self._pending[above]
+        if pending is None:
+            self._pending[above] = [row.copy(), timestamp, 1]
+            pending = self._pending[above]
+        else:
+            np.maximum(pending[0], row, out=pending[0])
+            pending[2] += 1
+        if pending[2] == self.decimation:
+            self._pending[above] = None
+            self._append(above, pending[0], pending[1])
+
+    def time_range(self):
+        with self._lock:
+            if len(self) == 0:
+                return None
+            ts = self.levels[0].ts
+            return float(ts[0]), float(ts[len(self) - 1])
+
+    @property
+    def last_timestamp(self):
+        time_range = self.time_range()
+        return None if time_range is None else time_range[1]
+
+    # Index of the last row at or before timestamp (0 if timestamp is before the first row), a binary search
+    # over the memory-mapped timestamps so only a handful of pages get touched
+    def seek(self, timestamp, level=0):
+        with self._lock:
+            return self._seek(timestamp, level)
+
+    def _seek(self, timestamp, level):
+        if level >= len(self.levels): # closed
+            return 0
+        lvl = self.levels[level]
+        index = int(np.searchsorted(lvl.ts[:lvl.count], timestamp, side="right")) - 1
+        return max(index, 0)
+
+    # Copies rows [start, stop) of a level out of the files, returns (timestamps, rows as float32).
+    # Reading a closed store gives no rows rather than an error, the GUI may still be reading while it closes.
+    def read(self, start, stop, level=0):
+        with self._lock:
+            if level >= len(self.levels):
+                return np.zeros(0), np.zeros((0, self.fft_size), dtype=np.float32)
+            lvl = self.levels[level]
+            start, stop = max(start, 0), min(stop, lvl.count)
+            return np.array(lvl.ts[start:stop]), np.array(lvl.rows[start:stop], dtype=np.float32)
+
+    # Up to num_rows rows ending at end_time, oldest first
+    def read_window(self, end_time, num_rows, level=0):
+        with self._lock:
+            if level >= len(self.levels) or self.levels[level].count == 0:
+                return np.zeros(0), np.zeros((0, self.fft_size), dtype=np.float32)
+            end = self._seek(end_time, level) + 1
+        return self.read(end - num_rows, end, level)
+
+    # Coarsest level that still has at least num_rows rows across span_seconds
+    def level_for_span(self, span_seconds, num_rows):
+        time_range = self.time_range()
+        if time_range is None or len(self) < 2:
+            return 0
+        row_period = (time_range[1] - time_range[0]) / (len(self) - 1)
+        rows_in_span = span_seconds / max(row_period, 1e-12)
+        level = 0
+        while level + 1 < self.num_levels and rows_in_span / self.decimation**(level + 1) >= num_rows:
+            level += 1
+        return level
+
+    def flush(self):
+        with self._lock:
+            for lvl in self.levels:
+                lvl.flush()
+
+    def close(self):
+        with self._lock:
+            for lvl in self.levels:
+                lvl.flush()
+            self.levels = []
+            self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,379 @@
+import errno
+import socket
+import struct
+import threading
+import queue
+import time
+import random
+from collections import namedtuple
+
+import numpy as np
+
+# Streams raw samples or PSD frames between a capture box and an operator screen.
+# Addresses look like ZeroMQ's: "tcp://host:port" or "udp://host:port", with "*" meaning all interfaces.
+#
+# Every frame is a fixed little-endian header followed by the values:
+#   magic "DSPF" | version u8 | kind u8 | dtype u8 | pad | stream_id u32 | seq u64 | timestamp f64 | sample_rate f64 | center_freq f64 | count u32
+# Complex samples are sent as interleaved real/imag pairs, so count is in samples rather than values.
+# stream_id is picked at random by each publisher, so a restarted publisher (seq back at 0) is seen as a new stream.
+
+KIND_REAL = 0 # real samples (mic, file)
+KIND_COMPLEX = 1 # IQ samples (SDRs, sim)
+KIND_PSD = 2 # one PSD row in dB, fftshifted like compute_psd() returns it
+
+MAGIC = b"DSPF"
+VERSION = 2
+HEADER = struct.Struct("<4sBBBxIQdddI")
+DTYPES = {0: np.dtype("<f4"), 1: np.dtype("<f2")} # dtype code -> wire dtype
+MAX_UDP_PAYLOAD = 65507
+
+Frame = namedtuple("Frame", ["kind", "stream_id", "seq", "timestamp", "sample_rate", "center_freq", "data"])
+
+
+def parse_address(address):
+    protocol, sep, rest = address.partition("://")
+    host, _, port = rest.rpartition(":")
+    if not sep or protocol not in ("tcp", "udp") or not host or not port.isdigit():
+        raise ValueError(f"Bad stream address {address!r}, expected tcp://host:port or udp://host:port")
+    if host == "*":
+        host = "0.0.0.0"
+    return protocol, host.strip("[]"), int(port)
+
+
+def dtype_code(dtype):
+    dtype = np.dtype(dtype).newbyteorder("<")
+    for code, wire_dtype in DTYPES.items():
+        if wire_dtype == dtype:
+            return code
+    raise ValueError(f"Unsupported stream dtype {dtype}, use float32 or float16")
+
+
+def frame_size(kind, count, dtype=np.float32):
+    return HEADER.size + payload_size(kind, dtype_code(dtype), count)
+
+
+def encode_frame(kind, data, seq, sample_rate, center_freq=0.0, timestamp=None, dtype=np.float32, stream_id=0):
+    code = dtype_code(dtype)
+    data = np.asarray(data)
+    if kind == KIND_COMPLEX:
+        values = data.astype(np.complex64).view(np.float32) # interleaved I/Q without an extra copy
+    else:
+        values = data.real
+    if timestamp is None:
+        timestamp = time.time()
+    header = HEADER.pack(MAGIC, VERSION, kind, code, stream_id, seq, timestamp, sample_rate, center_freq, len(data))
+    return header + values.astype(DTYPES[code], copy=False).tobytes()
+
+
+def decode_header(buf):
+    magic, version, kind, code, stream_id, seq, timestamp, sample_rate, center_freq, count = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a DSPlayground stream frame")
+    if kind not in (KIND_REAL, KIND_COMPLEX, KIND_PSD) or code not in DTYPES:
+        raise ValueError(f"Unknown frame kind {kind} or dtype {code}")
+    return kind, code, stream_id, seq, timestamp, sample_rate, center_freq, count
+
+
+def payload_size(kind, code, count):
+    values = 2*count if kind == KIND_COMPLEX else count
+    return values * DTYPES[code].itemsize
+
+
+def decode_frame(buf, header=None):
+    if header is None:
+        header = decode_header(buf)
+    kind, code, stream_id, seq, timestamp, sample_rate, center_freq, count = header
+    size = payload_size(kind, code, count)
+    if len(buf) - HEADER.size < size:
+        raise ValueError("Truncated stream frame")
+    values = np.frombuffer(buf, dtype=DTYPES[code], count=size // DTYPES[code].itemsize, offset=HEADER.size)
+    data = values.astype(np.float32)
+    if kind == KIND_COMPLEX:
+        data = data.view(np.complex64)
+    return Frame(kind, stream_id, seq, timestamp, sample_rate, center_freq, data)
+
+
+class StreamPublisher:
+    # The sending end. Over TCP it listens and serves any number of subscribers, each with its own bounded
+    # queue and sender thread, so one slow screen can't stall the capture loop: once a subscriber's queue is
+    # full its frames are dropped (the gap shows up in its sequence numbers), or the publisher waits when
+    # block=True. Over UDP every frame is a single datagram sent to the given address.
+    def __init__(self, address, dtype=np.float32, max_queue=64, block=False):
+        self.protocol, host, port = parse_address(address)
+        self.dtype = np.dtype(dtype)
+        dtype_code(self.dtype) # fail early on unsupported dtypes
+        self.max_queue = max_queue
+        self.block = block
+        self.stream_id = random.getrandbits(32)
+        self.seq = 0
+        self.dropped = 0 # frames not delivered to some subscriber because it was too slow
+        self.closed = False
+        self._clients = []
+        self._lock = threading.Lock()
+
+        if self.protocol == "tcp":
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((host, port))
+            self.sock.listen()
+            self.sock.settimeout(0.5) # so the accept loop notices close()
+            self.address = self.sock.getsockname() # the real port when bound to port 0
+            self._accept_thread = threading.Thread(target=self._accept_loop, name="StreamPublisher", daemon=True)
+            self._accept_thread.start()
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.address = (host, port)
+
+    @property
+    def num_subscribers(self):
+        with self._lock:
+            return len(self._clients)
+
+    def _accept_loop(self):
+        while not self.closed:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            frames = queue.Queue(self.max_queue)
+            with self._lock:
+                self._clients.append(frames)
+            threading.Thread(target=self._send_loop, args=(conn, frames), name="StreamPublisherClient", daemon=True).start()
+
+    def _send_loop(self, conn, frames):
+        try:
+            while True:
+                frame = frames.get()
+                if frame is None:
+                    break
+                conn.sendall(frame)
+        except OSError:
+            pass # subscriber went away
+        finally:
+            with self._lock:
+                if frames in self._clients:
+                    self._clients.remove(frames)
+            conn.close()
+
+    def publish(self, kind, data, sample_rate, center_freq=0.0, timestamp=None):
+        frame = encode_frame(kind, data, self.seq, sample_rate, center_freq, timestamp, self.dtype, self.stream_id)
+        seq = self.seq
+
+        if self.protocol == "udp":
+            self.check_frame_size(kind, len(data))
+            self.sock.sendto(frame, self.address)
+            self.seq += 1
+            return seq
+        self.seq += 1
+
+        with self._lock:
+            clients = list(self._clients)
+        for frames in clients:
+            try:
+                frames.put(frame, block=self.block)
+            except queue.Full:
+                self.dropped += 1
+        return seq
+
+    # Raises ValueError if frames of this kind and length can't be sent, worth calling once before streaming
+    def check_frame_size(self, kind, count):
+        size = frame_size(kind, count, self.dtype)
+        if self.protocol == "udp" and size > MAX_UDP_PAYLOAD:
+            raise ValueError(f"Frames of {size} bytes don't fit in a UDP datagram ({MAX_UDP_PAYLOAD} bytes max), "
+                             "use float16, a smaller fft_size or TCP")
+
+    def publish_samples(self, samples, sample_rate, center_freq=0.0, timestamp=None):
+        kind = KIND_COMPLEX if np.iscomplexobj(samples) else KIND_REAL
+        return self.publish(kind, samples, sample_rate, center_freq, timestamp)
+
+    def publish_psd(self, PSD, sample_rate, center_freq=0.0, timestamp=None):
+        return self.publish(KIND_PSD, PSD, sample_rate, center_freq, timestamp)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        with self._lock:
+            clients = list(self._clients)
+        for frames in clients:
+            # make room for the stop marker rather than waiting on a stuck subscriber
+            while True:
+                try:
+                    frames.put_nowait(None)
+                    break
+                except queue.Full:
+                    try:
+                        frames.get_nowait()
+                    except queue.Empty:
+                        pass
+        if self.protocol == "tcp":
+            self._accept_thread.join()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StreamSubscriber:
+    # The receiving end. A background thread reads frames into a bounded queue. Over TCP a full queue stops
+    # the thread reading, which pushes back on the publisher through the socket. Over UDP there is nothing to
+    # push back on, so the oldest queued frame is thrown away instead (counted in `overflowed`).
+    # Gaps in the sequence numbers are counted in `lost`, late/duplicate frames in `out_of_order`. A frame from
+    # a different stream_id (the publisher was restarted) starts the sequence tracking over, counted in `restarts`.
+    # A tcp:// address is the publisher to connect to, a udp:// one the local address to listen on (udp://*:5555).
+    def __init__(self, address, max_queue=64, connect_timeout=5.0):
+        self.protocol, host, port = parse_address(address)
+        self.received = 0
+        self.lost = 0
+        self.out_of_order = 0
+        self.overflowed = 0
+        self.restarts = 0
+        self.closed = False
+        self._stopping = False
+        self._stream_id = None
+        self._expected_seq = None
+        self._frames = queue.Queue(max_queue)
+
+        if self.protocol == "tcp":
+            self.sock = socket.create_connection((host, port), timeout=connect_timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                self.sock.bind((host, port))
+            except OSError as e:
+                self.sock.close()
+                if e.errno != errno.EADDRNOTAVAIL:
+                    raise
+                # easy to mix up with the publisher's address, which is where the datagrams are sent to
+                raise ValueError(f"{address} isn't an address of this machine. A UDP subscriber listens for the "
+                                 f"publisher's datagrams, use udp://*:{port}") from None
+        self.address = self.sock.getsockname()
+        self.sock.settimeout(0.5) # so the receive loop notices close()
+
+        self._thread = threading.Thread(target=self._recv_loop, name="StreamSubscriber", daemon=True)
+        self._thread.start()
+
+    def _recv_exact(self, buf):
+        view = memoryview(buf)
+        got = 0
+        while got < len(buf):
+            try:
+                n = self.sock.recv_into(view[got:])
+            except socket.timeout:
+                if self._stopping:
+                    return False
+                continue
+            if n == 0:
+                return False # publisher closed the connection
+            got += n
+        return True
+
+    def _read_tcp_frame(self):
+        header_buf = bytearray(HEADER.size)
+        if not self._recv_exact(header_buf):
+            return None
+        header = decode_header(header_buf)
+        kind, code, *_, count = header
+        buf = header_buf + bytearray(payload_size(kind, code, count))
+        if not self._recv_exact(memoryview(buf)[HEADER.size:]):
+            return None
+        return decode_frame(buf, header)
+
+    def _read_udp_frame(self):
+        while not self._stopping:
+            try:
+                datagram = self.sock.recv(65535)
+            except socket.timeout:
+                continue
+            try:
+                return decode_frame(datagram)
+            except (ValueError, struct.error):
+                continue # not ours or damaged, just skip it
+        return None
+
+    def _track(self, frame):
+        if frame.stream_id != self._stream_id:
+            if self._stream_id is not None:
+                self.restarts += 1
+            self._stream_id = frame.stream_id
+            self._expected_seq = None
+        if self._expected_seq is not None:
+            if frame.seq < self._expected_seq:
+                self.out_of_order += 1
+                return False
+            self.lost += frame.seq - self._expected_seq
+        self._expected_seq = frame.seq + 1
+        self.received += 1
+        return True
+
+    def _enqueue(self, frame):
+        if self.protocol == "udp":
+            while True:
+                try:
+                    self._frames.put_nowait(frame)
+                    return
+                except queue.Full:
+                    try:
+                        self._frames.get_nowait()
+                        self.overflowed += 1
+                    except queue.Empty:
+                        pass
+        while not self._stopping:
+            try:
+                self._frames.put(frame, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _recv_loop(self):
+        try:
+            while not self._stopping:
+                if self.protocol == "tcp":
+                    frame = self._read_tcp_frame()
+                else:
+                    frame = self._read_udp_frame()
+                if frame is None:
+                    break
+                if self._track(frame):
+                    self._enqueue(frame)
+        except (OSError, ValueError):
+            pass # connection dropped or the stream is garbage, either way we're done
+        finally:
+            self.closed = True
+
+    # Next frame, or None if nothing arrived within timeout or the stream has ended
+    def get(self, timeout=None):
+        if self.closed and self._frames.empty():
+            return None
+        try:
+            return self._frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        while True:
+            frame = self.get(timeout=0.5)
+            if frame is not None:
+                yield frame
+            elif self.closed:
+                return
+
+    def close(self):
+        self._stopping = True
+        self._thread.join()
+        self.sock.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,10 +1,13 @@
-from PyQt6.QtCore import QSize, Qt, QThread, pyqtSignal, QObject, QTimer
-from PyQt6.QtWidgets import QApplication, QMainWindow, QGridLayout, QWidget, QSlider, QLabel, QHBoxLayout, QVBoxLayout, QPushButton, QComboBox, QFileDialog, QMessageBox
-import pyqtgraph as pg
 import numpy as np
 import time
 import signal # lets control-C actually close the app
-import wave 
+import wave
+import sys
+import os
+import argparse
+
+# PyQt6, pyqtgraph and the SDR/audio drivers are only imported when they are actually needed
+# (see _build_qt_classes() and SpectrumCore.open()), so importing this module stays cheap and headless
 
 # Defaults
 fft_size = 4096 # determines buffer size
@@ -16,339 +19,894 @@ time_plot_samples = 500
 gain = 50 # 0 to 73 dB. int
 audio_sample_rate = 44100  # Audio standard (Hz)
 
-sdr_type = "mic" # "usrp" or "pluto" or "sim" or "mic" or "file"
-
-# Init SDR
-if sdr_type == "pluto":
-    import adi
-    sdr = adi.Pluto("ip:192.168.1.10")
-    sdr.rx_lo = int(center_freq)
-    sdr.sample_rate = int(sample_rate)
-    sdr.rx_rf_bandwidth = int(sample_rate*0.8) # antialiasing filter bandwidth
-    sdr.rx_buffer_size = int(fft_size)
-    sdr.gain_control_mode_chan0 = 'manual'
-    sdr.rx_hardwaregain_chan0 = gain # dB
-elif sdr_type == "usrp":
-    import uhd
-    #usrp = uhd.usrp.MultiUSRP(args="addr=192.168.1.10")
-    usrp = uhd.usrp.MultiUSRP(args="addr=192.168.1.201")
-    usrp.set_rx_rate(sample_rate, 0)
-    usrp.set_rx_freq(uhd.libpyuhd.types.tune_request(center_freq), 0)
-    usrp.set_rx_gain(gain, 0)
-
-    # Set up the stream and receive buffer
-    st_args = uhd.usrp.StreamArgs("fc32", "sc16")
-    st_args.channels = [0]
-    metadata = uhd.types.RXMetadata()
-    streamer = usrp.get_rx_stream(st_args)
-    recv_buffer = np.zeros((1, fft_size), dtype=np.complex64)
-
-    # Start Stream
-    stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.start_cont)
-    stream_cmd.stream_now = True
-    streamer.issue_stream_cmd(stream_cmd)
-
-    def flush_buffer():
-        for _ in range(10):
-            streamer.recv(recv_buffer, metadata)
-elif sdr_type == "mic":
-    import pyaudio
-    audio_interface = pyaudio.PyAudio()
-    audio_stream = audio_interface.open(
-        format=pyaudio.paFloat32,
-        channels=1,
-        rate=int(audio_sample_rate),
-        input=True,
-        frames_per_buffer=fft_size,
-    )
-    def cleanup():
-        audio_stream.stop_stream()
-        audio_stream.close()
-        audio_interface.terminate()
-    
-class SDRWorker(QObject):
-    def __init__(self):
-        super().__init__()
-        self.gain = gain
+sdr_type = "mic" # "usrp" or "pluto" or "sim" or "mic" or "file" or "net" or "replay"
+sdr_types = ["usrp", "pluto", "sim", "mic", "file", "net", "replay"]
+
+
+def compute_psd(samples, fft_size):
+    return 10.0*np.log10(np.abs(np.fft.fftshift(np.fft.fft(samples, fft_size)))**2/fft_size)
+
+
+def load_wav_data(filename):
+    # raises ValueError for anything we can't plot, the GUI turns that into a message box
+    with wave.open(filename, "rb") as wav_file:
+        if wav_file.getnchannels() != 1:
+            raise ValueError("Only mono WAV files are supported.")
+        return np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+
+
+class SpectrumCore:
+    # All of the analyzer's DSP (sample source, PSD averaging, waterfall buffer) with no Qt involved,
+    # so it can be driven by SDRWorker, by run_headless() or by any other processing code
+    def __init__(self, sdr_type=sdr_type, fft_size=fft_size, num_rows=num_rows, sample_rate=sample_rate,
+                 center_freq=center_freq, gain=gain, audio_sample_rate=audio_sample_rate, wav_data=None,
+                 net_address=None, publish_address=None, publish_psd=False, publish_dtype="float32", filter_spec="",
+                 history_path=None):
+        if sdr_type not in sdr_types:
+            raise ValueError(f"Unknown sdr_type {sdr_type!r}, expected one of {sdr_types}")
+        if int(fft_size) < 1 or int(num_rows) < 1:
+            raise ValueError("fft_size and num_rows must be at least 1")
+        self.sdr_type = sdr_type
+        self.fft_size = int(fft_size)
+        self.num_rows = int(num_rows)
         self.sample_rate = sample_rate
+        self.center_freq = center_freq
+        self.gain = gain
+        self.audio_sample_rate = audio_sample_rate
         self.freq = 0 # in kHz, to deal with QSlider being ints and with a max of 2 billion
-        self.spectrogram = -50*np.ones((fft_size, num_rows))
-        self.PSD_avg = -50*np.ones(fft_size)
-
-        if sdr_type == "file":
-            self.selected_wav_data = self.load_wav_file()
-            
-    def load_wav_file(self):
-        filename, _ = QFileDialog.getOpenFileName(None, "Select WAV File", "", "Audio Files (*.wav)")
-        if not filename:
-            QMessageBox.critical(None, "No File Selected", "A WAV file must be selected to proceed.")
-            exit(1)
-
+        self.spectrogram = -50*np.ones((self.fft_size, self.num_rows))
+        self.PSD_avg = -50*np.ones(self.fft_size)
+
+        self.selected_wav_data = wav_data
+
+        # network streaming (see dsplayground_netstream), "net" reads from net_address and any
+        # source can also be re-published to publish_address as raw samples or PSD frames
+        self.net_address = net_address
+        self.publish_address = publish_address
+        self.publish_psd = publish_psd
+        self.publish_dtype = publish_dtype
+        self.subscriber = None
+        self.publisher = None
+        self.reconnects = 0
+        self.reconnect_delay = 0.0 # while a dropped tcp:// stream is being retried
+        self.reconnect_at = 0.0
+
+        self.filter_chain = None
+        self.set_filter(filter_spec)
+
+        # every PSD row gets recorded to the history session at history_path (see dsplayground_history),
+        # "replay" plays a recorded session back instead
+        self.history_path = history_path
+        self.history_session = history_path # where rows go right now, moves on to history_path.2, .3... on retunes
+        self.history = None
+        self.replay_index = 0
+
+        self.is_open = False
+
+    # Device setup/teardown, drivers are imported here so only the selected one has to be installed
+    def open(self):
+        if self.is_open:
+            return
         try:
-            with wave.open(filename, "rb") as wav_file:
-                if wav_file.getnchannels() != 1:
-                    QMessageBox.critical(None, "Invalid File", "Only mono WAV files are supported.")
-                    exit(1)
-                data = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
-                QMessageBox.information(None, "File Loaded", f"Loaded {filename}")
-                return data
-        except Exception as e:
-            QMessageBox.critical(None, "Error", f"Failed to load WAV file: {e}")
-            exit(1)
-
-
-    # PyQt Signals
-    time_plot_update = pyqtSignal(np.ndarray)
-    freq_plot_update = pyqtSignal(np.ndarray)
-    waterfall_plot_update = pyqtSignal(np.ndarray)
-    end_of_run = pyqtSignal() # happens many times a second
-
-    # PyQt Slots
+            self._open()
+        except BaseException:
+            # undo whatever did get set up (history, sockets, devices) before reporting the error
+            self.is_open = True
+            self.close()
+            raise
+        self.is_open = True
+
+    def _open(self):
+        if self.publish_address is not None:
+            self._check_publish_config()
+        if self.history_path is not None and self.sdr_type not in ("net", "replay"):
+            self._open_history(self.fft_size) # up front, so a clashing session is reported before anything runs
+        if self.sdr_type == "pluto":
+            import adi
+            self.sdr = adi.Pluto("ip:192.168.1.10")
+            self.sdr.rx_lo = int(self.center_freq)
+            self.sdr.sample_rate = int(self.sample_rate)
+            self.sdr.rx_rf_bandwidth = int(self.sample_rate*0.8) # antialiasing filter bandwidth
+            self.sdr.rx_buffer_size = int(self.fft_size)
+            self.sdr.gain_control_mode_chan0 = 'manual'
+            self.sdr.rx_hardwaregain_chan0 = self.gain # dB
+        elif self.sdr_type == "usrp":
+            import uhd
+            self.uhd = uhd
+            #self.usrp = uhd.usrp.MultiUSRP(args="addr=192.168.1.10")
+            self.usrp = uhd.usrp.MultiUSRP(args="addr=192.168.1.201")
+            self.usrp.set_rx_rate(self.sample_rate, 0)
+            self.usrp.set_rx_freq(uhd.libpyuhd.types.tune_request(self.center_freq), 0)
+            self.usrp.set_rx_gain(self.gain, 0)
+
+            # Set up the stream and receive buffer
+            st_args = uhd.usrp.StreamArgs("fc32", "sc16")
+            st_args.channels = [0]
+            self.metadata = uhd.types.RXMetadata()
+            self.streamer = self.usrp.get_rx_stream(st_args)
+            self.recv_buffer = np.zeros((1, self.fft_size), dtype=np.complex64)
+
+            # Start Stream
+            stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.start_cont)
+            stream_cmd.stream_now = True
+            self.streamer.issue_stream_cmd(stream_cmd)
+        elif self.sdr_type == "mic":
+            import pyaudio
+            self.audio_interface = pyaudio.PyAudio()
+            self.audio_stream = self.audio_interface.open(
+                format=pyaudio.paFloat32,
+                channels=1,
+                rate=int(self.audio_sample_rate),
+                input=True,
+                frames_per_buffer=self.fft_size,
+            )
+        elif self.sdr_type == "file":
+            if self.selected_wav_data is None or len(self.selected_wav_data) == 0:
+                raise ValueError("\"file\" mode needs wav_data, see load_wav_data()")
+            # normalize once up front instead of rescanning the whole file every frame
+            self.wav_samples = self.selected_wav_data.astype(np.float32) / np.max(np.abs(self.selected_wav_data))
+        elif self.sdr_type == "net":
+            if self.net_address is None:
+                raise ValueError("\"net\" mode needs net_address, e.g. tcp://capturebox:5555")
+            from dsplayground_netstream import StreamSubscriber
+            self.subscriber = StreamSubscriber(self.net_address)
+        elif self.sdr_type == "replay":
+            if self.history_path is None:
+                raise ValueError("\"replay\" mode needs history_path")
+            from dsplayground_history import HistoryStore
+            self.history = HistoryStore(self.history_path, readonly=True)
+            if len(self.history) == 0:
+                raise ValueError(f"History session at {self.history_path} is empty")
+            self.sample_rate = self.history.sample_rate
+            self.center_freq = self.history.center_freq
+            self.replay_index = 0
+
+        if self.publish_address is not None:
+            from dsplayground_netstream import StreamPublisher
+            self.publisher = StreamPublisher(self.publish_address, dtype=self.publish_dtype)
+
+    # Fails at startup rather than on the first frame when the frames we'd publish can't be sent (UDP size limit)
+    def _check_publish_config(self):
+        from dsplayground_netstream import parse_address, frame_size, MAX_UDP_PAYLOAD, KIND_REAL, KIND_COMPLEX, KIND_PSD
+        protocol, _, _ = parse_address(self.publish_address)
+        if self.publish_psd or self.sdr_type == "replay":
+            kind = KIND_PSD
+        elif self.sdr_type in ("mic", "file"):
+            kind = KIND_REAL
+        else:
+            kind = KIND_COMPLEX # "net" could be relaying either, assume the bigger one
+        size = frame_size(kind, self.fft_size, self.publish_dtype)
+        if protocol == "udp" and size > MAX_UDP_PAYLOAD:
+            raise ValueError(f"Publishing {self.fft_size}-point frames needs {size} byte datagrams, more than UDP allows "
+                             f"({MAX_UDP_PAYLOAD} bytes). Use --publish-psd, --publish-dtype float16, a smaller --fft-size or tcp://")
+
+    # Loss/drop counters of the network stream(s), "" when not streaming
+    def stream_stats(self):
+        stats = []
+        if self.subscriber is not None:
+            sub = self.subscriber
+            stats.append(f"lost {sub.lost}, out of order {sub.out_of_order}, overflowed {sub.overflowed}, restarts {sub.restarts}")
+            if self.reconnect_delay:
+                stats.append("stream ended, reconnecting")
+            elif self.reconnects:
+                stats.append(f"reconnects {self.reconnects}")
+        if self.publisher is not None:
+            stats.append(f"dropped for slow subscribers {self.publisher.dropped}")
+        return ", ".join(stats)
+
+    def close(self):
+        if not self.is_open:
+            return
+        # also called by open() when it fails half way, so anything here may not have been set up yet
+        if self.sdr_type == "usrp" and hasattr(self, "streamer"):
+            stream_cmd = self.uhd.types.StreamCMD(self.uhd.types.StreamMode.stop_cont)
+            self.streamer.issue_stream_cmd(stream_cmd)
+        elif self.sdr_type == "mic" and hasattr(self, "audio_interface"):
+            if hasattr(self, "audio_stream"):
+                self.audio_stream.stop_stream()
+                self.audio_stream.close()
+            self.audio_interface.terminate()
+
+        if self.subscriber is not None:
+            self.subscriber.close()
+            self.subscriber = None
+
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+        self.is_open = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Rate the samples actually arrive at, audio sources ignore the SDR sample rate
+    @property
+    def input_sample_rate(self):
+        if self.sdr_type in ("mic", "file"):
+            return self.audio_sample_rate
+        return self.sample_rate
+
+    # Filter chain applied to every block before the FFT (see dsplayground_filters for the syntax), "" for none.
+    # Raises ValueError on a bad spec and keeps the previous chain in that case.
+    def set_filter(self, spec):
+        if not spec.strip():
+            self.filter_spec, self.filter_chain = "", None
+            return
+        from dsplayground_filters import parse_filter_chain
+        chain = parse_filter_chain(spec, self.input_sample_rate)
+        self.filter_spec, self.filter_rate = spec, self.input_sample_rate
+        self.filter_chain = chain # swapped in one go, so a GUI thread can call this while step() runs
+
+    def filter(self, samples):
+        chain = self.filter_chain
+        if chain is None:
+            return samples
+        if self.filter_rate != self.input_sample_rate: # cutoffs are in Hz, redesign for the new rate
+            try:
+                self.set_filter(self.filter_spec)
+                chain = self.filter_chain
+            except ValueError as e:
+                print("Dropping filter chain:", e)
+                self.set_filter("")
+                return samples
+        return chain.process(samples)
+
+    def flush_buffer(self):
+        for _ in range(10):
+            self.streamer.recv(self.recv_buffer, self.metadata)
+
+    # Tuning
     def update_freq(self, val):
         print("Updated freq to:", val, 'MHz')
-        if sdr_type == "pluto":
-            sdr.rx_lo = int(val*1e3)
-        elif sdr_type == "usrp":
-            usrp.set_rx_freq(uhd.libpyuhd.types.tune_request(val*1e3), 0)
-            flush_buffer()
+        self.freq = val
+        self.center_freq = val*1e3
+        if self.sdr_type == "pluto":
+            self.sdr.rx_lo = int(val*1e3)
+        elif self.sdr_type == "usrp":
+            self.usrp.set_rx_freq(self.uhd.libpyuhd.types.tune_request(val*1e3), 0)
+            self.flush_buffer()
 
     def update_gain(self, val):
         print("Updated gain to:", val, 'dB')
         self.gain = val
-        if sdr_type == "pluto":
-            sdr.rx_hardwaregain_chan0 = val
-        elif sdr_type == "usrp":
-            usrp.set_rx_gain(val, 0)
-            flush_buffer()
+        if self.sdr_type == "pluto":
+            self.sdr.rx_hardwaregain_chan0 = val
+        elif self.sdr_type == "usrp":
+            self.usrp.set_rx_gain(val, 0)
+            self.flush_buffer()
 
     def update_sample_rate(self, val):
         print("Updated sample rate to:", sample_rates[val], 'MHz')
-        if sdr_type == "pluto":
-            sdr.sample_rate = int(sample_rates[val] * 1e6)
-            sdr.rx_rf_bandwidth = int(sample_rates[val] * 1e6 * 0.8)
-        elif sdr_type == "usrp":
-            usrp.set_rx_rate(sample_rates[val] * 1e6, 0)
-            flush_buffer()
-
-    # Main loop
-    def run(self):
-        start_t = time.time()
-
-        if sdr_type == "pluto":
-            samples = sdr.rx()/2**11 # Receive samples
-        elif sdr_type == "usrp":
-            streamer.recv(recv_buffer, metadata)
-            samples = recv_buffer[0] # will be np.complex64
-        elif sdr_type == "sim":
-            tone = np.exp(2j*np.pi*self.sample_rate*0.1*np.arange(fft_size)/self.sample_rate)
-            noise = np.random.randn(fft_size) + 1j*np.random.randn(fft_size)
+        if self.sdr_type in ("pluto", "usrp", "sim"):
+            self.sample_rate = sample_rates[val] * 1e6
+        if self.sdr_type == "pluto":
+            self.sdr.sample_rate = int(sample_rates[val] * 1e6)
+            self.sdr.rx_rf_bandwidth = int(sample_rates[val] * 1e6 * 0.8)
+        elif self.sdr_type == "usrp":
+            self.usrp.set_rx_rate(sample_rates[val] * 1e6, 0)
+            self.flush_buffer()
+
+    # Grabs one block of fft_size samples from the source, None if the source doesn't exist
+    def read_samples(self):
+        if self.sdr_type == "pluto":
+            samples = self.sdr.rx()/2**11 # Receive samples
+        elif self.sdr_type == "usrp":
+            self.streamer.recv(self.recv_buffer, self.metadata)
+            samples = self.recv_buffer[0] # will be np.complex64
+        elif self.sdr_type == "sim":
+            tone = np.exp(2j*np.pi*self.sample_rate*0.1*np.arange(self.fft_size)/self.sample_rate)
+            noise = np.random.randn(self.fft_size) + 1j*np.random.randn(self.fft_size)
             samples = self.gain*tone*0.02 + 0.1*noise
-            
+
             # Truncate to -1 to +1 to simulate ADC bit limits
             np.clip(samples.real, -1, 1, out=samples.real)
             np.clip(samples.imag, -1, 1, out=samples.imag)
-        elif sdr_type == "mic":
-            audio_data = audio_stream.read(fft_size, exception_on_overflow=False)
+        elif self.sdr_type == "mic":
+            audio_data = self.audio_stream.read(self.fft_size, exception_on_overflow=False)
             samples = np.frombuffer(audio_data, dtype=np.float32)
-        elif sdr_type == "file":
+        elif self.sdr_type == "file":
             # Loop through WAV data
-            num_samples = len(self.selected_wav_data)
-            index = int((time.time() * audio_sample_rate) % num_samples)
-            samples = self.selected_wav_data[index:index + fft_size].astype(np.float32) / np.max(np.abs(self.selected_wav_data))
-            if len(samples) < fft_size:  # Loop back if end is reached
-                samples = np.concatenate([samples, self.selected_wav_data[:fft_size - len(samples)]])
+            num_samples = len(self.wav_samples)
+            index = int((time.time() * self.audio_sample_rate) % num_samples)
+            samples = self.wav_samples[index:index + self.fft_size]
+            if len(samples) < self.fft_size:  # Loop back if end is reached
+                samples = np.resize(np.concatenate([samples, self.wav_samples]), self.fft_size)
         else:
-            return
-
-        self.time_plot_update.emit(samples[0:time_plot_samples])
-
-        PSD = 10.0*np.log10(np.abs(np.fft.fftshift(np.fft.fft(samples)))**2/fft_size)
-
-        if sdr_type == "mic": 
+            return None
+        return samples
+
+    # Updates PSD_avg and the waterfall with a block of samples, returns that block's PSD
+    def process(self, samples, timestamp=None):
+        PSD = compute_psd(samples, self.fft_size)
+        self.update_psd(PSD, timestamp)
+        return PSD
+
+    def _resize(self, fft_size):
+        self.fft_size = fft_size
+        self.spectrogram = -50*np.ones((self.fft_size, self.num_rows))
+        self.PSD_avg = -50*np.ones(self.fft_size)
+
+    # Same as process() but for a PSD that was already computed somewhere else (e.g. received over the network)
+    def update_psd(self, PSD, timestamp=None):
+        if len(PSD) != self.fft_size: # the far end decides the size, follow it
+            self._resize(len(PSD))
+        self._record(PSD, timestamp)
+
+        if self.sdr_type == "mic":
             self.PSD_avg = PSD # preferred by nature of real-time mic input
         else:
             self.PSD_avg = self.PSD_avg * 0.99 + PSD * 0.01
-            
-        self.freq_plot_update.emit(self.PSD_avg)
 
         self.spectrogram[:] = np.roll(self.spectrogram, 1, axis=1) # shifts waterfall 1 row
         self.spectrogram[:,0] = PSD # fill last row with new fft results
-        self.waterfall_plot_update.emit(self.spectrogram)
-
-        print("Frames per second:", 1/(time.time() - start_t))
-        self.end_of_run.emit() # emit the signal to keep the loop going
-
-
-# Subclass SpectrumAnalyzer to customize your application's main window
-class SpectrumAnalyzer(QMainWindow):
-    def __init__(self):
-        super().__init__()
-
-        self.setWindowTitle("DSPlayground: Spectrum Analyzer")
-        self.setFixedSize(QSize(1500, 1000)) # window size, starting size should fit on 1920 x 1080
-
-        self.spectrogram_min = 0
-        self.spectrogram_max = 0
-
-        layout = QGridLayout() # overall layout
-
-        # Initialize worker and thread
-        self.sdr_thread = QThread()
-        self.sdr_thread.setObjectName('SDR_Thread') # so we can see it in htop, note you have to hit F2 -> Display options -> Show custom thread names
-        worker = SDRWorker()
-        worker.moveToThread(self.sdr_thread)
-
-        # Time plot
-        time_plot = pg.PlotWidget(labels={'left': 'Amplitude', 'bottom': 'Time [microseconds]'})
-        time_plot.setMouseEnabled(x=False, y=True)
-        time_plot.setYRange(-1.1, 1.1)
-        time_plot_curve_i = time_plot.plot([])
-        time_plot_curve_q = time_plot.plot([])
-        layout.addWidget(time_plot, 1, 0)
-
-        # Time plot auto range buttons
-        time_plot_auto_range_layout = QVBoxLayout()
-        layout.addLayout(time_plot_auto_range_layout, 1, 1)
-        auto_range_button = QPushButton('Auto Range')
-        auto_range_button.clicked.connect(lambda : time_plot.autoRange()) # lambda just means its an unnamed function
-        time_plot_auto_range_layout.addWidget(auto_range_button)
-        auto_range_button2 = QPushButton('-1 to +1\n(ADC limits)')
-        auto_range_button2.clicked.connect(lambda : time_plot.setYRange(-1.1, 1.1))
-        time_plot_auto_range_layout.addWidget(auto_range_button2)
-
-        # Freq plot
-        if sdr_type == "mic" or sdr_type == "tones" or sdr_type == "file":
-            freq_plot = pg.PlotWidget(labels={'left': 'PSD', 'bottom': 'Frequency [kHz]'})
+
+    def _open_history(self, fft_size):
+        from dsplayground_history import HistoryStore
+        self.history = HistoryStore(self.history_session, fft_size=fft_size, sample_rate=self.input_sample_rate,
+                                    center_freq=self.center_freq)
+        self.clock_went_back = False
+
+    # A session holds a single fft_size/tuning, so after a retune (sliders, or the far end of a "net" stream)
+    # recording carries on in a fresh session next to the first one
+    def _roll_history(self):
+        self.history.close()
+        self.history = None
+        n = 2
+        while os.path.exists(f"{self.history_path}.{n}"):
+            n += 1
+        self.history_session = f"{self.history_path}.{n}"
+        print(f"Settings changed, recording history to {self.history_session}")
+
+    def _stop_recording(self, reason):
+        print(reason + ", no longer recording history")
+        if self.history is not None:
+            self.history.close()
+        self.history_path = self.history = None
+
+    # Never raises: this runs inside the capture loop, where an exception would stop the GUI's worker for good
+    def _record(self, PSD, timestamp):
+        if self.history_path is None or self.sdr_type == "replay":
+            return
+        store = self.history
+        if store is not None and (store.fft_size, store.sample_rate, store.center_freq) != (len(PSD), self.input_sample_rate, self.center_freq):
+            self._roll_history()
+        if self.history is None: # "net" opens it on the first row, once the far end's fft_size is known, and so do rolled sessions
+            try:
+                self._open_history(len(PSD))
+            except (ValueError, OSError) as e:
+                self._stop_recording(str(e))
+                return
+
+        if timestamp is None:
+            timestamp = time.time()
+        last_timestamp = self.history.last_timestamp
+        if last_timestamp is not None and timestamp < last_timestamp: # e.g. NTP stepped the clock back
+            if not self.clock_went_back:
+                print(f"Clock went back {last_timestamp - timestamp:.3f} s, holding history timestamps until it catches up")
+            self.clock_went_back = True
+            timestamp = last_timestamp
+        else:
+            self.clock_went_back = False
+        try:
+            self.history.append(PSD, timestamp)
+        except (ValueError, OSError) as e: # disk full, a clock before 1970...
+            self._stop_recording(f"Recording history failed ({e})")
+
+    # One read + process (+ publish), returns the raw samples or None once the source has nothing more to give.
+    # Frames that carry only a PSD, and "net" timeouts, give back an empty array.
+    def step(self):
+        if self.sdr_type == "net":
+            return self._step_net()
+        if self.sdr_type == "replay":
+            return self._step_replay()
+        samples = self.read_samples()
+        if samples is None:
+            return None
+        samples = self.filter(samples)
+        PSD = self.process(samples)
+        self._publish(samples, PSD)
+        return samples
+
+    def _step_net(self):
+        from dsplayground_netstream import KIND_PSD
+        if self.subscriber.closed:
+            self._reconnect()
+            return np.zeros(0, dtype=np.float32)
+        frame = self.subscriber.get(timeout=1.0)
+        if frame is None:
+            return np.zeros(0, dtype=np.float32)
+        self.sample_rate = frame.sample_rate
+        self.center_freq = frame.center_freq
+        if frame.kind == KIND_PSD:
+            samples = np.zeros(0, dtype=np.float32)
+            PSD = frame.data.astype(np.float64)
+            self.update_psd(PSD, frame.timestamp)
         else:
-            freq_plot = pg.PlotWidget(labels={'left': 'PSD', 'bottom': 'Frequency [MHz]'})
-        freq_plot.setMouseEnabled(x=False, y=True)
-        freq_plot_curve = freq_plot.plot([])
-        freq_plot.setXRange(center_freq/1e6 - sample_rate/2e6, center_freq/1e6 + sample_rate/2e6)
-        freq_plot.setYRange(-30, 20)
-        layout.addWidget(freq_plot, 2, 0)
-
-        # Freq auto range button
-        auto_range_button = QPushButton('Auto Range')
-        auto_range_button.clicked.connect(lambda : freq_plot.autoRange()) # lambda just means its an unnamed function
-        layout.addWidget(auto_range_button, 2, 1)
-
-        # Layout container for waterfall related stuff
-        waterfall_layout = QHBoxLayout()
-        layout.addLayout(waterfall_layout, 3, 0)
-
-        # Waterfall plot
-        waterfall = pg.PlotWidget(labels={'left': 'Time [s]', 'bottom': 'Frequency [kHz]'})
-        imageitem = pg.ImageItem(axisOrder='col-major') # this arg is purely for performance
-        waterfall.addItem(imageitem)
-        waterfall.setMouseEnabled(x=False, y=False)
-        waterfall_layout.addWidget(waterfall)
-
-        # Colorbar for waterfall
-        colorbar = pg.HistogramLUTWidget()
-        colorbar.setImageItem(imageitem) # connects the bar to the waterfall imageitem
-        colorbar.item.gradient.loadPreset('viridis') # set the color map, also sets the imageitem
-        imageitem.setLevels((-30, 20)) # needs to come after colorbar is created for some reason
-        waterfall_layout.addWidget(colorbar)
-
-        # Waterfall auto range button
-        auto_range_button = QPushButton('Auto Range\n(-2σ to +2σ)')
-        def update_colormap():
-            imageitem.setLevels((self.spectrogram_min, self.spectrogram_max))
-            colorbar.setLevels(self.spectrogram_min, self.spectrogram_max)
-        auto_range_button.clicked.connect(update_colormap)
-        layout.addWidget(auto_range_button, 3, 1)
-
-        # Freq slider with label, all units in kHz
-        freq_slider = QSlider(Qt.Orientation.Horizontal)
-        freq_slider.setRange(0, int(6e6))
-        freq_slider.setValue(int(center_freq/1e3))
-        freq_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
-        freq_slider.setTickInterval(int(1e6))
-        freq_slider.sliderMoved.connect(worker.update_freq) # there's also a valueChanged option
-        freq_label = QLabel()
-        def update_freq_label(val):
-            freq_label.setText("Frequency [MHz]: " + str(val/1e3))
-            freq_plot.autoRange()
-        freq_slider.sliderMoved.connect(update_freq_label)
-        update_freq_label(freq_slider.value()) # initialize the label
-        layout.addWidget(freq_slider, 4, 0)
-        layout.addWidget(freq_label, 4, 1)
-
-        # Gain slider with label
-        gain_slider = QSlider(Qt.Orientation.Horizontal)
-        gain_slider.setRange(0, 73)
-        gain_slider.setValue(gain)
-        gain_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
-        gain_slider.setTickInterval(2)
-        gain_slider.sliderMoved.connect(worker.update_gain)
-        gain_label = QLabel()
-        def update_gain_label(val):
-            gain_label.setText("Gain: " + str(val))
-        gain_slider.sliderMoved.connect(update_gain_label)
-        update_gain_label(gain_slider.value()) # initialize the label
-        layout.addWidget(gain_slider, 5, 0)
-        layout.addWidget(gain_label, 5, 1)
-
-        # sliders don't have effect on real-time audio signal
-        if sdr_type == "mic":
-            freq_slider.setEnabled(False)
-            gain_slider.setEnabled(False)
-
-        # Sample rate dropdown using QComboBox
-        sample_rate_combobox = QComboBox()
-        sample_rate_combobox.addItems([str(x) + ' kHz' for x in sample_rates])
-        sample_rate_combobox.setCurrentIndex(0) # should match the default at the top
-        sample_rate_combobox.currentIndexChanged.connect(worker.update_sample_rate)
-        sample_rate_label = QLabel()
-        def update_sample_rate_label(val):
-            sample_rate_label.setText("Sample Rate: " + str(sample_rates[val]) + " kHz")
-        sample_rate_combobox.currentIndexChanged.connect(update_sample_rate_label)
-        update_sample_rate_label(sample_rate_combobox.currentIndex()) # initialize the label
-        layout.addWidget(sample_rate_combobox, 6, 0)
-        layout.addWidget(sample_rate_label, 6, 1)
-
-        central_widget = QWidget()
-        central_widget.setLayout(layout)
-        self.setCentralWidget(central_widget)
-
-        # Signals and slots stuff
-        def time_plot_callback(samples):
-            time_plot_curve_i.setData(samples.real)
-            time_plot_curve_q.setData(samples.imag)
-
-        def freq_plot_callback(PSD_avg):
-            # TODO figure out if there's a way to just change the visual ticks instead of the actual x vals
-            f = np.linspace(freq_slider.value()*1e3 - worker.sample_rate/2.0, freq_slider.value()*1e3 + worker.sample_rate/2.0, fft_size) / 1e6
-            freq_plot_curve.setData(f, PSD_avg)
-            freq_plot.setXRange(freq_slider.value()*1e3/1e6 - worker.sample_rate/2e6, freq_slider.value()*1e3/1e6 + worker.sample_rate/2e6)
-
-        def waterfall_plot_callback(spectrogram):
-            imageitem.setImage(spectrogram, autoLevels=False)
-            sigma = np.std(spectrogram)
-            mean = np.mean(spectrogram)
-            self.spectrogram_min = mean - 2*sigma # save to window state
-            self.spectrogram_max = mean + 2*sigma
-
-        def end_of_run_callback():
-            QTimer.singleShot(0, worker.run) # Run worker again immediately
-
-        worker.time_plot_update.connect(time_plot_callback) # connect the signal to the callback
-        worker.freq_plot_update.connect(freq_plot_callback)
-        worker.waterfall_plot_update.connect(waterfall_plot_callback)
-        worker.end_of_run.connect(end_of_run_callback)
-
-        self.sdr_thread.started.connect(worker.run) # kicks off the worker when the thread starts
-        self.sdr_thread.start()
-
-
-app = QApplication([])
-window = SpectrumAnalyzer()
-window.show() # Windows are hidden by default
-signal.signal(signal.SIGINT, signal.SIG_DFL) # this lets control-C actually close the app
-app.exec() # Start the event loop
-
-if sdr_type == "usrp":
-    stream_cmd = uhd.types.StreamCMD(uhd.types.StreamMode.stop_cont)
-    streamer.issue_stream_cmd(stream_cmd)
-elif sdr_type == "mic":
-    cleanup()
+            if len(frame.data) != self.fft_size: # the far end decides the block size, like it does for PSD frames
+                self._resize(len(frame.data))
+            samples = self.filter(frame.data)
+            PSD = self.process(samples, frame.timestamp)
+        self._publish(samples, PSD)
+        return samples
+
+    # The tcp:// publisher went away (restarted, network dropped): keep retrying with exponential backoff,
+    # the display just stays frozen on the last frame until it comes back
+    def _reconnect(self):
+        from dsplayground_netstream import StreamSubscriber
+        wait = self.reconnect_at - time.time()
+        if wait > 0:
+            time.sleep(min(wait, 0.5)) # short naps so close() from the GUI isn't held up
+            return
+        if not self.reconnect_delay:
+            print(f"Stream from {self.net_address} ended, reconnecting", file=sys.stderr)
+        try:
+            subscriber = StreamSubscriber(self.net_address, connect_timeout=2.0)
+        except OSError:
+            self.reconnect_delay = min(max(2*self.reconnect_delay, 0.5), 10.0)
+            self.reconnect_at = time.time() + self.reconnect_delay
+            return
+        self.subscriber.close()
+        self.subscriber = subscriber
+        self.reconnect_delay = 0.0
+        self.reconnects += 1
+        print(f"Reconnected to {self.net_address}", file=sys.stderr)
+
+    def _step_replay(self):
+        # plays the recorded rows back at the pace they were recorded, looping like "file" does
+        if self.replay_index >= len(self.history):
+            self.replay_index = 0
+        timestamps, rows = self.history.read(self.replay_index, self.replay_index + 2)
+        if len(timestamps) == 2:
+            time.sleep(min(timestamps[1] - timestamps[0], 1.0))
+        PSD = rows[0].astype(np.float64)
+        self.update_psd(PSD)
+        self._publish(np.zeros(0, dtype=np.float32), PSD)
+        self.replay_index += 1
+        return np.zeros(0, dtype=np.float32)
+
+    def _publish(self, samples, PSD):
+        if self.publisher is None:
+            return
+        try:
+            if self.publish_psd or len(samples) == 0: # "replay" and relayed PSD frames have nothing else to send
+                self.publisher.publish_psd(PSD, self.input_sample_rate, self.center_freq)
+            elif len(samples):
+                self.publisher.publish_samples(samples, self.input_sample_rate, self.center_freq)
+        except ValueError as e: # a relayed stream switched to blocks too big for UDP, stop rather than crash
+            print(f"Stopped publishing to {self.publish_address}: {e}", file=sys.stderr)
+            self.publisher.close()
+            self.publisher = None
+
+
+# Text-only loop around SpectrumCore, handy for checking a source without a display
+def run_headless(core, num_frames=None, report_every=50):
+    frame = 0
+    start_t = time.time()
+    while num_frames is None or frame < num_frames:
+        if core.step() is None:
+            break
+        frame += 1
+        if frame % report_every == 0:
+            peak_bin = int(np.argmax(core.PSD_avg))
+            peak_offset = (peak_bin - core.fft_size//2) * core.input_sample_rate / core.fft_size
+            stats = core.stream_stats()
+            print(f"Frame {frame}: {frame/(time.time() - start_t):.1f} fps, peak {core.PSD_avg[peak_bin]:.1f} dB at {peak_offset:+.1f} Hz offset"
+                  + (f", {stats}" if stats else ""))
+    return frame
+
+
+# The Qt side (SDRWorker and SpectrumAnalyzer) is built on first use, so `import dsplayground_spectrumanalyzer`
+# never pulls in PyQt6/pyqtgraph. Accessing either name as a module attribute triggers the build.
+_qt_classes = {}
+
+def _build_qt_classes():
+    if _qt_classes:
+        return _qt_classes
+
+    from PyQt6.QtCore import QSize, Qt, QThread, pyqtSignal, QObject, QTimer
+    from PyQt6.QtWidgets import QMainWindow, QGridLayout, QWidget, QSlider, QLabel, QHBoxLayout, QVBoxLayout, QPushButton, QComboBox, QFileDialog, QMessageBox, QLineEdit
+    import pyqtgraph as pg
+
+    class SDRWorker(QObject):
+        # Thin Qt wrapper that runs a SpectrumCore in its own thread and emits the results
+        def __init__(self, core):
+            super().__init__()
+            self.core = core
+
+        @property
+        def sample_rate(self):
+            return self.core.sample_rate
+
+        @staticmethod
+        def load_wav_file():
+            filename, _ = QFileDialog.getOpenFileName(None, "Select WAV File", "", "Audio Files (*.wav)")
+            if not filename:
+                QMessageBox.critical(None, "No File Selected", "A WAV file must be selected to proceed.")
+                exit(1)
+
+            try:
+                data = load_wav_data(filename)
+            except ValueError as e:
+                QMessageBox.critical(None, "Invalid File", str(e))
+                exit(1)
+            except Exception as e:
+                QMessageBox.critical(None, "Error", f"Failed to load WAV file: {e}")
+                exit(1)
+            QMessageBox.information(None, "File Loaded", f"Loaded {filename}")
+            return data
+
+        # PyQt Signals
+        time_plot_update = pyqtSignal(np.ndarray)
+        freq_plot_update = pyqtSignal(np.ndarray)
+        waterfall_plot_update = pyqtSignal(np.ndarray)
+        end_of_run = pyqtSignal() # happens many times a second
+
+        # PyQt Slots
+        def update_freq(self, val):
+            self.core.update_freq(val)
+
+        def update_gain(self, val):
+            self.core.update_gain(val)
+
+        def update_sample_rate(self, val):
+            self.core.update_sample_rate(val)
+
+        # Main loop
+        def run(self):
+            start_t = time.time()
+
+            samples = self.core.step()
+            if samples is None:
+                return
+
+            self.time_plot_update.emit(samples[0:time_plot_samples])
+            self.freq_plot_update.emit(self.core.PSD_avg)
+            self.waterfall_plot_update.emit(self.core.spectrogram)
+
+            stats = self.core.stream_stats()
+            if stats:
+                print("Frames per second:", 1/(time.time() - start_t), "|", stats)
+            else:
+                print("Frames per second:", 1/(time.time() - start_t))
+            self.end_of_run.emit() # emit the signal to keep the loop going
+
+
+    # Subclass SpectrumAnalyzer to customize your application's main window
+    class SpectrumAnalyzer(QMainWindow):
+        def __init__(self, core):
+            super().__init__()
+
+            self.setWindowTitle("DSPlayground: Spectrum Analyzer")
+            self.setFixedSize(QSize(1500, 1000)) # window size, starting size should fit on 1920 x 1080
+
+            self.spectrogram_min = 0
+            self.spectrogram_max = 0
+            self.viewing_history = False # True while the waterfall is scrolled back, live rows are then ignored
+
+            layout = QGridLayout() # overall layout
+
+            # Initialize worker and thread
+            self.sdr_thread = QThread()
+            self.sdr_thread.setObjectName('SDR_Thread') # so we can see it in htop, note you have to hit F2 -> Display options -> Show custom thread names
+            worker = SDRWorker(core)
+            worker.moveToThread(self.sdr_thread)
+
+            # Time plot
+            time_plot = pg.PlotWidget(labels={'left': 'Amplitude', 'bottom': 'Time [microseconds]'})
+            time_plot.setMouseEnabled(x=False, y=True)
+            time_plot.setYRange(-1.1, 1.1)
+            time_plot_curve_i = time_plot.plot([])
+            time_plot_curve_q = time_plot.plot([])
+            layout.addWidget(time_plot, 1, 0)
+
+            # Time plot auto range buttons
+            time_plot_auto_range_layout = QVBoxLayout()
+            layout.addLayout(time_plot_auto_range_layout, 1, 1)
+            auto_range_button = QPushButton('Auto Range')
+            auto_range_button.clicked.connect(lambda : time_plot.autoRange()) # lambda just means its an unnamed function
+            time_plot_auto_range_layout.addWidget(auto_range_button)
+            auto_range_button2 = QPushButton('-1 to +1\n(ADC limits)')
+            auto_range_button2.clicked.connect(lambda : time_plot.setYRange(-1.1, 1.1))
+            time_plot_auto_range_layout.addWidget(auto_range_button2)
+
+            # Freq plot
+            if core.sdr_type == "mic" or core.sdr_type == "tones" or core.sdr_type == "file":
+                freq_plot = pg.PlotWidget(labels={'left': 'PSD', 'bottom': 'Frequency [kHz]'})
+            else:
+                freq_plot = pg.PlotWidget(labels={'left': 'PSD', 'bottom': 'Frequency [MHz]'})
+            freq_plot.setMouseEnabled(x=False, y=True)
+            freq_plot_curve = freq_plot.plot([])
+            freq_plot.setXRange(core.center_freq/1e6 - core.sample_rate/2e6, core.center_freq/1e6 + core.sample_rate/2e6)
+            freq_plot.setYRange(-30, 20)
+            layout.addWidget(freq_plot, 2, 0)
+
+            # Freq auto range button
+            auto_range_button = QPushButton('Auto Range')
+            auto_range_button.clicked.connect(lambda : freq_plot.autoRange()) # lambda just means its an unnamed function
+            layout.addWidget(auto_range_button, 2, 1)
+
+            # Layout container for waterfall related stuff
+            waterfall_layout = QHBoxLayout()
+            layout.addLayout(waterfall_layout, 3, 0)
+
+            # Waterfall plot
+            waterfall = pg.PlotWidget(labels={'left': 'Time [s]', 'bottom': 'Frequency [kHz]'})
+            imageitem = pg.ImageItem(axisOrder='col-major') # this arg is purely for performance
+            waterfall.addItem(imageitem)
+            waterfall.setMouseEnabled(x=False, y=False)
+            waterfall_layout.addWidget(waterfall)
+
+            # Colorbar for waterfall
+            colorbar = pg.HistogramLUTWidget()
+            colorbar.setImageItem(imageitem) # connects the bar to the waterfall imageitem
+            colorbar.item.gradient.loadPreset('viridis') # set the color map, also sets the imageitem
+            imageitem.setLevels((-30, 20)) # needs to come after colorbar is created for some reason
+            waterfall_layout.addWidget(colorbar)
+
+            # Waterfall auto range button
+            auto_range_button = QPushButton('Auto Range\n(-2σ to +2σ)')
+            def update_colormap():
+                imageitem.setLevels((self.spectrogram_min, self.spectrogram_max))
+                colorbar.setLevels(self.spectrogram_min, self.spectrogram_max)
+            auto_range_button.clicked.connect(update_colormap)
+            layout.addWidget(auto_range_button, 3, 1)
+
+            # Freq slider with label, all units in kHz
+            freq_slider = QSlider(Qt.Orientation.Horizontal)
+            freq_slider.setRange(0, int(6e6))
+            freq_slider.setValue(int(core.center_freq/1e3))
+            freq_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
+            freq_slider.setTickInterval(int(1e6))
+            freq_slider.sliderMoved.connect(worker.update_freq) # there's also a valueChanged option
+            freq_label = QLabel()
+            def update_freq_label(val):
+                freq_label.setText("Frequency [MHz]: " + str(val/1e3))
+                freq_plot.autoRange()
+            freq_slider.sliderMoved.connect(update_freq_label)
+            update_freq_label(freq_slider.value()) # initialize the label
+            layout.addWidget(freq_slider, 4, 0)
+            layout.addWidget(freq_label, 4, 1)
+
+            # Gain slider with label
+            gain_slider = QSlider(Qt.Orientation.Horizontal)
+            gain_slider.setRange(0, 73)
+            gain_slider.setValue(int(core.gain))
+            gain_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
+            gain_slider.setTickInterval(2)
+            gain_slider.sliderMoved.connect(worker.update_gain)
+            gain_label = QLabel()
+            def update_gain_label(val):
+                gain_label.setText("Gain: " + str(val))
+            gain_slider.sliderMoved.connect(update_gain_label)
+            update_gain_label(gain_slider.value()) # initialize the label
+            layout.addWidget(gain_slider, 5, 0)
+            layout.addWidget(gain_label, 5, 1)
+
+            # sliders don't have effect on real-time audio signal
+            if core.sdr_type == "mic":
+                freq_slider.setEnabled(False)
+                gain_slider.setEnabled(False)
+
+            # Sample rate dropdown using QComboBox
+            sample_rate_combobox = QComboBox()
+            sample_rate_combobox.addItems([str(x) + ' kHz' for x in sample_rates])
+            if core.sample_rate/1e6 in sample_rates: # start on whatever rate the core was created with
+                sample_rate_combobox.setCurrentIndex(sample_rates.index(core.sample_rate/1e6))
+            else:
+                sample_rate_combobox.setCurrentIndex(0)
+            sample_rate_combobox.currentIndexChanged.connect(worker.update_sample_rate)
+            sample_rate_label = QLabel()
+            def update_sample_rate_label(val):
+                sample_rate_label.setText("Sample Rate: " + str(sample_rates[val]) + " kHz")
+            sample_rate_combobox.currentIndexChanged.connect(update_sample_rate_label)
+            update_sample_rate_label(sample_rate_combobox.currentIndex()) # initialize the label
+            layout.addWidget(sample_rate_combobox, 6, 0)
+            layout.addWidget(sample_rate_label, 6, 1)
+
+            # Filter chain text box, applied when enter is pressed
+            filter_input = QLineEdit()
+            filter_input.setPlaceholderText('e.g. dc, lowpass 5000, fir-bandpass 300 3000 1023')
+            filter_input.setText(core.filter_spec)
+            filter_label = QLabel()
+            def update_filter():
+                try:
+                    core.set_filter(filter_input.text())
+                except ValueError as e:
+                    QMessageBox.warning(self, "Invalid Filter", str(e))
+                    filter_input.setText(core.filter_spec)
+                filter_label.setText("Filter: " + (core.filter_spec or "none"))
+            filter_input.returnPressed.connect(update_filter)
+            filter_label.setText("Filter: " + (core.filter_spec or "none"))
+            layout.addWidget(filter_input, 7, 0)
+            layout.addWidget(filter_label, 7, 1)
+
+            # Waterfall history scroll-back, all the way right is live. Only there when recording/replaying (--history)
+            if core.history_path is not None:
+                history_spans = [("Full detail", 0), ("10 s", 10), ("1 min", 60), ("10 min", 600), ("1 h", 3600), ("Whole session", None)]
+                history_layout = QHBoxLayout()
+                history_slider = QSlider(Qt.Orientation.Horizontal)
+                history_slider.setRange(0, 1000)
+                history_slider.setValue(1000)
+                history_layout.addWidget(history_slider)
+                history_zoom_combobox = QComboBox() # roughly how much time the waterfall should cover
+                history_zoom_combobox.addItems([name for name, _ in history_spans])
+                history_layout.addWidget(history_zoom_combobox)
+                history_label = QLabel("History: live")
+                def update_history_view():
+                    store = core.history
+                    time_range = store.time_range() if store is not None else None # None too while a session rolls over
+                    if time_range is None or history_slider.value() == history_slider.maximum():
+                        self.viewing_history = False
+                        history_label.setText("History: live")
+                        return
+                    self.viewing_history = True
+                    first_t, last_t = time_range
+                    end_t = first_t + (last_t - first_t) * history_slider.value() / history_slider.maximum()
+                    span = history_spans[history_zoom_combobox.currentIndex()][1]
+                    if span is None:
+                        span = last_t - first_t
+                    level = store.level_for_span(span, core.num_rows) # coarser mipmap levels for longer spans
+                    _, rows = store.read_window(end_t, core.num_rows, level)
+                    image = -50*np.ones((store.fft_size, core.num_rows))
+                    image[:, :len(rows)] = rows[::-1].T # newest row first, same as the live waterfall
+                    imageitem.setImage(image, autoLevels=False)
+                    history_label.setText(f"History: {end_t - last_t:.1f} s ({store.decimation**level}x)")
+                history_slider.valueChanged.connect(update_history_view)
+                history_zoom_combobox.currentIndexChanged.connect(update_history_view)
+                layout.addLayout(history_layout, 8, 0)
+                layout.addWidget(history_label, 8, 1)
+
+            central_widget = QWidget()
+            central_widget.setLayout(layout)
+            self.setCentralWidget(central_widget)
+
+            # Signals and slots stuff
+            def time_plot_callback(samples):
+                time_plot_curve_i.setData(samples.real)
+                time_plot_curve_q.setData(samples.imag)
+
+            def freq_plot_callback(PSD_avg):
+                # TODO figure out if there's a way to just change the visual ticks instead of the actual x vals
+                f = np.linspace(freq_slider.value()*1e3 - worker.sample_rate/2.0, freq_slider.value()*1e3 + worker.sample_rate/2.0, core.fft_size) / 1e6
+                freq_plot_curve.setData(f, PSD_avg)
+                freq_plot.setXRange(freq_slider.value()*1e3/1e6 - worker.sample_rate/2e6, freq_slider.value()*1e3/1e6 + worker.sample_rate/2e6)
+
+            def waterfall_plot_callback(spectrogram):
+                if self.viewing_history:
+                    return
+                imageitem.setImage(spectrogram, autoLevels=False)
+                sigma = np.std(spectrogram)
+                mean = np.mean(spectrogram)
+                self.spectrogram_min = mean - 2*sigma # save to window state
+                self.spectrogram_max = mean + 2*sigma
+
+            def end_of_run_callback():
+                QTimer.singleShot(0, worker.run) # Run worker again immediately
+
+            worker.time_plot_update.connect(time_plot_callback) # connect the signal to the callback
+            worker.freq_plot_update.connect(freq_plot_callback)
+            worker.waterfall_plot_update.connect(waterfall_plot_callback)
+            worker.end_of_run.connect(end_of_run_callback)
+
+            self.sdr_thread.started.connect(worker.run) # kicks off the worker when the thread starts
+            self.sdr_thread.start()
+
+    _qt_classes.update(SDRWorker=SDRWorker, SpectrumAnalyzer=SpectrumAnalyzer)
+    return _qt_classes
+
+
+def __getattr__(name):
+    if name in ("SDRWorker", "SpectrumAnalyzer"):
+        return _build_qt_classes()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# argparse types that reject zero/negative values up front instead of failing somewhere inside step()
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {text}")
+    return value
+
+
+def positive_float(text):
+    value = float(text)
+    if not 0 < value < float("inf"):
+        raise argparse.ArgumentTypeError(f"must be greater than 0, not {text}")
+    return value
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DSPlayground: Spectrum Analyzer")
+    parser.add_argument("--source", choices=sdr_types, default=sdr_type, help="where samples come from (default: %(default)s)")
+    parser.add_argument("--file", help="WAV file for the \"file\" source, a file dialog is shown if omitted")
+    parser.add_argument("--fft-size", type=positive_int, default=fft_size, help="samples per FFT/block (default: %(default)s)")
+    parser.add_argument("--num-rows", type=positive_int, default=num_rows, help="waterfall rows (default: %(default)s)")
+    parser.add_argument("--sample-rate", type=positive_float, default=sample_rates[0], help="SDR sample rate in MHz (default: %(default)s)")
+    parser.add_argument("--audio-sample-rate", type=positive_int, default=audio_sample_rate, help="mic/file sample rate in Hz (default: %(default)s)")
+    parser.add_argument("--center-freq", type=float, default=center_freq, help="SDR center frequency in Hz (default: %(default)s)")
+    parser.add_argument("--gain", type=int, default=gain, help="SDR gain in dB, 0 to 73 (default: %(default)s)")
+    parser.add_argument("--connect", metavar="ADDRESS", help="stream to read with --source net, e.g. tcp://capturebox:5555, or udp://*:5555 to listen for a UDP publisher")
+    parser.add_argument("--publish", metavar="ADDRESS", help="also stream out whatever is analyzed, e.g. tcp://*:5555 or udp://screen:5555")
+    parser.add_argument("--publish-psd", action="store_true", help="publish PSD frames instead of raw samples (far less bandwidth), replay always publishes PSD frames")
+    parser.add_argument("--publish-dtype", choices=["float32", "float16"], default="float32", help="wire format for published values (default: %(default)s)")
+    parser.add_argument("--filter", default="", metavar="CHAIN", help="filter chain applied before the FFT, e.g. \"dc, lowpass 5000\"")
+    parser.add_argument("--history", metavar="DIR", help="record the PSD history to this session directory, or play it back with --source replay")
+    parser.add_argument("--headless", action="store_true", help="run without the GUI, printing stats to stdout")
+    parser.add_argument("--frames", type=positive_int, default=None, help="stop after this many frames (headless only)")
+    return parser.parse_args(argv)
+
+
+def make_core(args, wav_data=None):
+    return SpectrumCore(sdr_type=args.source, fft_size=args.fft_size, num_rows=args.num_rows,
+                        sample_rate=args.sample_rate * 1e6, center_freq=args.center_freq, gain=args.gain,
+                        audio_sample_rate=args.audio_sample_rate, wav_data=wav_data, net_address=args.connect,
+                        publish_address=args.publish, publish_psd=args.publish_psd, publish_dtype=args.publish_dtype,
+                        filter_spec=args.filter, history_path=args.history)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    wav_data = None
+    if args.source == "file" and args.file:
+        try:
+            wav_data = load_wav_data(args.file)
+        except (OSError, EOFError, wave.Error, ValueError) as e:
+            print(f"Error: Failed to load WAV file {args.file}: {e}", file=sys.stderr)
+            return 2
+
+    if args.source == "net" and args.connect is None:
+        print("--source net needs --connect", file=sys.stderr)
+        return 2
+    if args.source == "replay" and args.history is None:
+        print("--source replay needs --history", file=sys.stderr)
+        return 2
+
+    if args.headless:
+        if args.source == "file" and wav_data is None:
+            print("--headless with --source file needs --file", file=sys.stderr)
+            return 2
+        try:
+            core = make_core(args, wav_data)
+            core.open()
+        except (ValueError, OSError) as e: # bad config (filter, stream, history session, port in use...), report it before running anything
+            print("Error:", e, file=sys.stderr)
+            return 2
+        with core:
+            try:
+                run_headless(core, args.frames)
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    from PyQt6.QtWidgets import QApplication, QMessageBox
+    app = QApplication([])
+    qt_classes = _build_qt_classes()
+    if args.source == "file" and wav_data is None:
+        wav_data = qt_classes["SDRWorker"].load_wav_file()
+
+    try:
+        core = make_core(args, wav_data)
+        core.open()
+    except (ValueError, OSError) as e:
+        print("Error:", e, file=sys.stderr)
+        QMessageBox.critical(None, "Error", str(e))
+        return 2
+    with core:
+        window = qt_classes["SpectrumAnalyzer"](core)
+        window.show() # Windows are hidden by default
+        signal.signal(signal.SIGINT, signal.SIG_DFL) # this lets control-C actually close the app
+        return app.exec() # Start the event loop
+
+
+if __name__ == "__main__":
+    sys.exit(main())
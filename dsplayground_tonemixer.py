@@ -5,7 +5,9 @@ from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLa
 from PyQt6.QtCore import Qt
 from tones import SINE_WAVE, SQUARE_WAVE, TRIANGLE_WAVE, SAWTOOTH_WAVE
 from tones.mixer import Mixer
+from dsplayground_filters import parse_filter_chain
 import sounddevice as sd
+import wave
 from datetime import datetime
 
 
@@ -34,6 +36,7 @@ class ToneMixer(QWidget):
         self.duration_input = self.create_text_input('Duration (seconds)', default='1')
         self.sampling_rate_input = self.create_text_input('Discrete Sampling Rate (Hz)')
         self.fft_size_input = self.create_text_input('FFT Size', default=str(self.fft_size))
+        self.filter_chain_input = self.create_text_input('Filter Chain (e.g. dc, lowpass 1000)')
 
         layout.addWidget(self.mixer_sampling_rate_input)
         layout.addWidget(self.mixer_amplitude_input)
@@ -46,6 +49,7 @@ class ToneMixer(QWidget):
         layout.addWidget(self.duration_input)
         layout.addWidget(self.sampling_rate_input)
         layout.addWidget(self.fft_size_input)
+        layout.addWidget(self.filter_chain_input)
 
         self.save_plot_checkbox = {}
         self.save_sound_checkbox = QCheckBox("Save as WAV")
@@ -360,11 +364,30 @@ class ToneMixer(QWidget):
         noise = np.random.normal(0, np.sqrt(noise_power_avg), len(self.mixed_samples))
         self.mixed_samples += noise
 
+        filter_spec = self.filter_chain_input.findChild(QLineEdit).text().strip()
+        if filter_spec:
+            try:
+                filter_chain = parse_filter_chain(filter_spec, self.mixer_sample_rate)
+            except ValueError as e:
+                self.show_warning("Invalid Filter", str(e))
+                self.mixed_samples = None
+                return
+            self.mixed_samples = filter_chain.process(self.mixed_samples)
+
         if save_to_wav:
             filename = f"play_sound_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
-            mixer.write_wav(filename)
+            self.write_wav(filename)
             print(f"Sound saved as {filename}")
 
+    def write_wav(self, filename):
+        # saves what actually gets played (noise and filters included) rather than the mixer's clean output
+        pcm = (np.clip(self.mixed_samples, -1, 1) * 32767).astype(np.int16)
+        with wave.open(filename, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2) # 16-bit
+            wav_file.setframerate(self.mixer_sample_rate)
+            wav_file.writeframes(pcm.tobytes())
+
 
     def get_input_text(self, input_widget):
         text = input_widget.findChild(QLineEdit).text().strip()
@@ -0,0 +1,88 @@
+import sys
+
+import numpy as np
+import pytest
+
+from dsplayground_filters import BiquadCascade, FIRFilter, biquad, fir_taps, max_num_taps, parse_filter_chain
+
+sample_rate = 48000
+
+
+def signal(n, complex_=False):
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal(n)
+    if complex_:
+        x = x + 1j*rng.standard_normal(n)
+    return x
+
+
+def in_blocks(chain, x, sizes):
+    out = []
+    start = 0
+    for size in sizes:
+        out.append(chain.process(x[start:start + size]))
+        start += size
+    out.append(chain.process(x[start:]))
+    return np.concatenate(out)
+
+
+@pytest.mark.parametrize("spec", [
+    "dc",
+    "lowpass 1000, notch 3000 5",
+    "fir-lowpass 3000 31", # direct convolution
+    "fir-bandpass 500 4000 1023", # overlap-save
+    "dc, highpass 100, fir-lowpass 3000 1023, bandpass 1500 2",
+])
+@pytest.mark.parametrize("complex_", [False, True])
+def test_blocks_match_one_shot(spec, complex_):
+    x = signal(20000, complex_)
+    expected = parse_filter_chain(spec, sample_rate).process(x)
+    got = in_blocks(parse_filter_chain(spec, sample_rate), x, [1, 0, 7, 1024, 3000, 5, 4096])
+    np.testing.assert_allclose(got, expected, atol=1e-9)
+
+
+@pytest.mark.parametrize("num_taps", [65, 255, 4095])
+def test_fft_path_matches_convolve(num_taps):
+    taps = fir_taps("lowpass", [2000], sample_rate, num_taps)
+    fir = FIRFilter(taps)
+    assert fir.use_fft
+    x = signal(10000)
+    np.testing.assert_allclose(fir.process(x), np.convolve(x, taps)[:len(x)], atol=1e-9)
+
+
+def test_python_fallback_matches_sosfilt(monkeypatch):
+    pytest.importorskip("scipy.signal")
+    x = signal(2000)
+    expected = biquad("lowpass", 1000, sample_rate).then(biquad("notch", 50, sample_rate, 10)).process(x)
+    monkeypatch.setitem(sys.modules, "scipy.signal", None) # makes the import in process() fail
+    cascade = biquad("lowpass", 1000, sample_rate).then(biquad("notch", 50, sample_rate, 10))
+    np.testing.assert_allclose(in_blocks(cascade, x, [500, 3]), expected, atol=1e-9)
+
+
+def test_biquads_merge_into_one_stage():
+    chain = parse_filter_chain("dc, lowpass 1000, highpass 50, fir-lowpass 5000, notch 60", sample_rate)
+    assert [type(stage) for stage in chain.stages] == [BiquadCascade, FIRFilter, BiquadCascade]
+    assert len(chain.stages[0].sos) == 3
+
+
+def test_empty_spec_passes_through():
+    x = signal(100)
+    np.testing.assert_array_equal(parse_filter_chain(" , ", sample_rate).process(x), x)
+
+
+@pytest.mark.parametrize("spec", [
+    "lowpass", # missing frequency
+    "lowpass abc",
+    "lowpass 30000", # above Nyquist
+    "lowpass 1000 nan",
+    "notch inf",
+    "dc 1.5",
+    "fir-lowpass 1000 12.5",
+    "fir-lowpass 1000 inf",
+    f"fir-lowpass 1000 {max_num_taps + 1}",
+    "fir-bandpass 1000",
+    "wobble 3",
+])
+def test_bad_specs_raise_value_error(spec):
+    with pytest.raises(ValueError):
+        parse_filter_chain(spec, sample_rate)
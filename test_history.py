@@ -0,0 +1,141 @@
+import threading
+
+import numpy as np
+import pytest
+
+from dsplayground_history import HistoryStore
+from dsplayground_netstream import KIND_PSD, StreamSubscriber
+from dsplayground_spectrumanalyzer import SpectrumCore
+
+fft_size = 16
+
+
+def rows(n, start=0):
+    return np.arange(start, start + n)[:, None] + np.zeros(fft_size, dtype=np.float32)
+
+
+def record(path, n, start=0, **kwargs):
+    with HistoryStore(str(path), fft_size=fft_size, sample_rate=1e6, center_freq=100e6, chunk_rows=8, **kwargs) as store:
+        for i, row in enumerate(rows(n, start)):
+            store.append(row, 1000.0 + start + i)
+
+
+def test_rows_and_mipmaps(tmp_path):
+    record(tmp_path, 70)
+    with HistoryStore(str(tmp_path), readonly=True) as store:
+        assert len(store) == 70
+        assert [store.level_len(level) for level in range(store.num_levels)] == [70, 17, 4, 1]
+        timestamps, level0 = store.read(0, 70)
+        np.testing.assert_array_equal(level0[:, 0], np.arange(70))
+        np.testing.assert_array_equal(timestamps, 1000.0 + np.arange(70))
+        # each level-1 row is the max of 4 level-0 rows, stamped with the first one's time
+        timestamps, level1 = store.read(0, 17, level=1)
+        np.testing.assert_array_equal(level1[:, 0], np.arange(3, 70, 4))
+        np.testing.assert_array_equal(timestamps, 1000.0 + np.arange(0, 68, 4))
+
+
+def test_reopen_recovers_count_and_pending_rows(tmp_path):
+    # stopping at 70 rows leaves partially max-held rows on levels 1-3, reopening has to pick them back up
+    record(tmp_path, 70)
+    record(tmp_path, 58, start=70)
+    record(tmp_path / "straight", 128)
+    with HistoryStore(str(tmp_path), readonly=True) as reopened, HistoryStore(str(tmp_path / "straight"), readonly=True) as straight:
+        assert reopened.num_levels == straight.num_levels
+        for level in range(straight.num_levels):
+            n = straight.level_len(level)
+            assert reopened.level_len(level) == n
+            for got, expected in zip(reopened.read(0, n, level), straight.read(0, n, level)):
+                np.testing.assert_array_equal(got, expected)
+
+
+def test_seek_and_read_window(tmp_path):
+    record(tmp_path, 40)
+    with HistoryStore(str(tmp_path), readonly=True) as store:
+        assert store.seek(0) == 0
+        assert store.seek(1010.0) == 10
+        assert store.seek(1010.5) == 10
+        assert store.seek(1e9) == 39
+        timestamps, window = store.read_window(1010.0, 4)
+        np.testing.assert_array_equal(timestamps, [1007.0, 1008.0, 1009.0, 1010.0])
+        assert store.time_range() == (1000.0, 1039.0)
+
+
+def test_reopen_checks_settings(tmp_path):
+    record(tmp_path, 4)
+    with pytest.raises(ValueError, match="center_freq"):
+        HistoryStore(str(tmp_path), fft_size=fft_size, sample_rate=1e6, center_freq=101e6)
+    with pytest.raises(ValueError, match="fft_size"):
+        HistoryStore(str(tmp_path), fft_size=32)
+    with pytest.raises(FileNotFoundError):
+        HistoryStore(str(tmp_path / "nothing"), readonly=True)
+
+
+def test_bad_timestamps(tmp_path):
+    with HistoryStore(str(tmp_path), fft_size=fft_size) as store:
+        store.append(rows(1)[0], 1000.0)
+        with pytest.raises(ValueError):
+            store.append(rows(1)[0], 999.0)
+        with pytest.raises(ValueError):
+            store.append(rows(1)[0], 0.0)
+        assert len(store) == 1
+
+
+def test_reads_while_closing(tmp_path):
+    record(tmp_path, 200)
+    store = HistoryStore(str(tmp_path), readonly=True)
+    errors = []
+
+    def reader():
+        try:
+            for _ in range(2000):
+                store.read_window(1100.0, 50, level=1)
+                store.read(0, 50)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    store.close()
+    thread.join()
+    assert errors == []
+    assert store.read(0, 10)[1].shape == (0, fft_size)
+
+    writer = HistoryStore(str(tmp_path), fft_size=fft_size)
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.append(rows(1)[0])
+
+
+def test_core_rolls_session_on_retune(tmp_path):
+    path = str(tmp_path / "session")
+    with SpectrumCore("sim", 64, 10, 1e6, 100e6, 0, 44100, history_path=path) as core:
+        for _ in range(3):
+            core.step()
+        core.update_freq(200e3) # kHz, like the slider
+        for _ in range(2):
+            core.step()
+        assert core.history_session == path + ".2"
+    with HistoryStore(path, fft_size=64, sample_rate=1e6, center_freq=100e6, readonly=True) as first:
+        assert len(first) == 3
+    with HistoryStore(path + ".2", fft_size=64, sample_rate=1e6, center_freq=200e6, readonly=True) as second:
+        assert len(second) == 2
+
+
+def test_core_stops_recording_on_bad_timestamp(tmp_path):
+    with SpectrumCore("sim", 64, 10, 1e6, 100e3, 0, 44100, history_path=str(tmp_path)) as core:
+        core.update_psd(np.zeros(64), timestamp=-1.0)
+        assert core.history is None and core.history_path is None
+        core.update_psd(np.zeros(64)) # keeps running without recording
+
+
+def test_replay_publishes_psd_frames(tmp_path):
+    record(tmp_path, 3)
+    with StreamSubscriber("udp://127.0.0.1:0") as sub:
+        core = SpectrumCore("replay", fft_size, 10, 1e6, 100e3, 0, 44100, history_path=str(tmp_path),
+                            publish_address=f"udp://127.0.0.1:{sub.address[1]}")
+        with core:
+            core.step()
+        frame = sub.get(timeout=5.0)
+    assert frame.kind == KIND_PSD
+    np.testing.assert_array_equal(frame.data, rows(1)[0])
+    assert frame.center_freq == 100e6
@@ -0,0 +1,151 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from dsplayground_netstream import (KIND_REAL, KIND_COMPLEX, KIND_PSD, Frame, StreamPublisher, StreamSubscriber,
+                                    decode_frame, encode_frame, frame_size)
+from dsplayground_spectrumanalyzer import SpectrumCore
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def noise(n):
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(n) + 1j*rng.standard_normal(n)).astype(np.complex64)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.parametrize("kind, data", [
+    (KIND_REAL, np.linspace(-1, 1, 100, dtype=np.float32)),
+    (KIND_COMPLEX, (np.arange(64) + 1j*np.arange(64)[::-1]).astype(np.complex64)),
+    (KIND_PSD, np.linspace(-120, 0, 1024, dtype=np.float32)),
+])
+def test_frame_round_trip(kind, data):
+    buf = encode_frame(kind, data, 7, 48e3, 100e6, timestamp=123.5, stream_id=42)
+    assert len(buf) == frame_size(kind, len(data))
+    frame = decode_frame(buf)
+    assert (frame.kind, frame.stream_id, frame.seq) == (kind, 42, 7)
+    assert (frame.timestamp, frame.sample_rate, frame.center_freq) == (123.5, 48e3, 100e6)
+    np.testing.assert_array_equal(frame.data, data)
+
+
+def test_frame_float16_round_trip():
+    data = np.linspace(-100, 0, 256, dtype=np.float32)
+    frame = decode_frame(encode_frame(KIND_PSD, data, 0, 1e6, dtype=np.float16))
+    np.testing.assert_allclose(frame.data, data, atol=0.05)
+
+
+def test_bad_frames_are_rejected():
+    buf = encode_frame(KIND_REAL, np.zeros(16), 0, 1e3)
+    with pytest.raises(ValueError):
+        decode_frame(b"XXXX" + buf[4:])
+    with pytest.raises(ValueError):
+        decode_frame(buf[:-4])
+
+
+def test_sequence_tracking():
+    sub = StreamSubscriber("udp://127.0.0.1:0")
+    try:
+        def frame(stream_id, seq):
+            return Frame(KIND_REAL, stream_id, seq, 0.0, 1e3, 0.0, np.zeros(1))
+
+        for seq in (0, 1, 4, 5, 3):
+            sub._track(frame(1, seq))
+        assert (sub.received, sub.lost, sub.out_of_order) == (4, 2, 1)
+
+        # a restarted publisher starts over at seq 0 with a new stream_id, that's not out of order
+        sub._track(frame(2, 0))
+        sub._track(frame(2, 1))
+        assert (sub.received, sub.lost, sub.out_of_order, sub.restarts) == (6, 2, 1, 1)
+    finally:
+        sub.close()
+
+
+def test_tcp_loopback():
+    with StreamPublisher("tcp://127.0.0.1:0") as pub:
+        with StreamSubscriber(f"tcp://127.0.0.1:{pub.address[1]}") as sub:
+            wait_for(lambda: pub.num_subscribers == 1)
+            blocks = [np.full(256, i, dtype=np.complex64) for i in range(10)]
+            for block in blocks:
+                pub.publish_samples(block, 1e6, 915e6)
+            frames = [sub.get(timeout=5.0) for _ in blocks]
+    assert [frame.seq for frame in frames] == list(range(10))
+    for frame, block in zip(frames, blocks):
+        np.testing.assert_array_equal(frame.data, block)
+    assert sub.lost == 0
+
+
+def test_tcp_publisher_gone_closes_subscriber():
+    pub = StreamPublisher("tcp://127.0.0.1:0")
+    with StreamSubscriber(f"tcp://127.0.0.1:{pub.address[1]}") as sub:
+        wait_for(lambda: pub.num_subscribers == 1)
+        pub.close()
+        wait_for(lambda: sub.closed)
+        assert sub.get(timeout=0.1) is None
+
+
+def test_udp_loopback_counts_gaps():
+    with StreamSubscriber("udp://127.0.0.1:0") as sub:
+        with StreamPublisher(f"udp://127.0.0.1:{sub.address[1]}") as pub:
+            pub.publish_psd(np.zeros(128), 1e6)
+            pub.seq += 3 # as if three datagrams got lost
+            pub.publish_psd(np.ones(128), 1e6)
+            frames = [sub.get(timeout=5.0) for _ in range(2)]
+    assert [frame.seq for frame in frames] == [0, 4]
+    assert sub.lost == 3
+
+
+def test_udp_subscriber_needs_local_address():
+    with pytest.raises(ValueError, match=r"udp://\*:"):
+        StreamSubscriber("udp://192.0.2.1:5555") # TEST-NET, never one of ours
+
+
+def test_oversize_udp_frames_are_refused():
+    with StreamPublisher("udp://127.0.0.1:9") as pub:
+        with pytest.raises(ValueError):
+            pub.publish_samples(np.zeros(16384, dtype=np.complex64), 1e6)
+
+
+def test_core_follows_raw_block_size_and_reconnects():
+    port = free_port()
+    pub = StreamPublisher(f"tcp://127.0.0.1:{port}")
+    core = SpectrumCore("net", 1024, 20, 1e6, 100e3, 0, 44100, net_address=f"tcp://127.0.0.1:{port}")
+    with core:
+        wait_for(lambda: pub.num_subscribers == 1)
+        pub.publish_samples(noise(512), 2e6, 915e6)
+        assert len(core.step()) == 512
+        assert core.fft_size == 512 and core.spectrogram.shape == (512, 20)
+        assert core.sample_rate == 2e6
+
+        # publisher restarts on the same port, the core picks the stream back up
+        pub.close()
+        wait_for(lambda: core.step() is not None and core.reconnect_delay > 0)
+        pub = StreamPublisher(f"tcp://127.0.0.1:{port}")
+        wait_for(lambda: core.step() is not None and core.reconnects == 1, timeout=15.0)
+        wait_for(lambda: pub.num_subscribers == 1)
+        pub.publish_samples(noise(256), 2e6)
+        wait_for(lambda: len(core.step()) == 256)
+    pub.close()
+
+
+def test_failed_open_releases_what_it_set_up(tmp_path):
+    with StreamPublisher("tcp://127.0.0.1:0") as busy:
+        core = SpectrumCore("sim", 256, 10, 1e6, 100e3, 0, 44100,
+                            publish_address=f"tcp://127.0.0.1:{busy.address[1]}", history_path=str(tmp_path / "session"))
+        with pytest.raises(OSError):
+            core.open()
+    assert not core.is_open
+    assert core.history is None and core.publisher is None